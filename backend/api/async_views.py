@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_READ_WORKERS,
+        thread_name_prefix='async-views'
+    )
+
+
+def call_view(view, request, *args, **kwargs):
+    """
+    Выполняет синхронное представление view в потоке пула
+    и возвращает отрендеренный ответ.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view, write_view=None):
+    """
+    Асинхронная обертка синхронного представления чтения view.
+
+    Кэш и база данных синхронные, поэтому представление выполняется
+    в пуле из settings.ASYNC_READ_WORKERS потоков, а цикл событий
+    в это время обслуживает других клиентов. Размер пула ограничивает
+    количество соединений с базой данных в процессе.
+
+    Остальные методы передаются синхронному представлению write_view
+    в общем потоке sync_to_async, как обычные синхронные представления
+    Django под ASGI.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if write_view is not None and request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(call_view)(
+                write_view, request, *args, **kwargs
+            )
+        return await sync_to_async(
+            call_view,
+            thread_sensitive=False,
+            executor=get_executor()
+        )(view, request, *args, **kwargs)
+    return wrapper
+
+
+recipe_list = async_view(
+    RecipeViewSet.as_view({'get': 'list'}),
+    RecipeViewSet.as_view({'post': 'create'})
+)
+recipe_detail = async_view(
+    RecipeViewSet.as_view({'get': 'retrieve'}),
+    RecipeViewSet.as_view({
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    })
+)
+tag_list = async_view(TagViewSet.as_view({'get': 'list'}))
+tag_detail = async_view(TagViewSet.as_view({'get': 'retrieve'}))
+ingredient_list = async_view(IngredientViewSet.as_view({'get': 'list'}))
+ingredient_detail = async_view(
+    IngredientViewSet.as_view({'get': 'retrieve'})
+)
@@ -0,0 +1,73 @@
+from bisect import bisect_left
+from threading import Lock
+
+from core.cache import get_version
+from recipes.models import Ingredient, normalize
+
+INGREDIENTS_VERSION_NAME = 'ingredients'
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный список нормализованных названий, поиск
+    по префиксу выполняется бинарным поиском, совпадения по подстроке
+    идут после совпадений по префиксу. Индекс перестраивается, когда
+    меняется версия справочника ингредиентов в кэше.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.data = None
+        self.lock = Lock()
+
+    def refresh(self, max_size):
+        """
+        Перестраивает индекс, если справочник изменился.
+
+        Возвращает False, если ингредиентов больше max_size
+        и искать нужно в базе данных.
+        """
+        version = get_version(INGREDIENTS_VERSION_NAME)
+        if version == self.version:
+            return self.data is not None
+        with self.lock:
+            if version == self.version:
+                return self.data is not None
+            if Ingredient.objects.count() > max_size:
+                self.data = None
+                self.version = version
+                return False
+            items = list(Ingredient.objects.order_by('pk').values(
+                'id', 'name', 'measurement_unit'
+            ))
+            by_name = sorted(
+                (normalize(item['name']), position)
+                for position, item in enumerate(items)
+            )
+            self.data = (items, by_name, [name for name, _ in by_name])
+            self.version = version
+        return True
+
+    def search(self, query, limit=None):
+        items, by_name, names = self.data
+        query = normalize(query)
+        if not query:
+            return items[:limit]
+        start = end = bisect_left(names, query)
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        result = [items[position] for _, position in by_name[start:end]]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for index, (name, position) in enumerate(by_name):
+            if start <= index < end or query not in name:
+                continue
+            result.append(items[position])
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,126 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from core.cache import get_version
+from recipes.models import IngredientRecipe
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: отдает строку вместо записи в файл."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_version_name(user_id):
+    return f'shopping_cart:{user_id}'
+
+
+def get_shopping_cart(user):
+    """Суммарное количество ингредиентов из списка покупок пользователя."""
+    return IngredientRecipe.objects.filter(
+        recipe__is_in_shopping_cart__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def format_line(ingredient):
+    return (f'{ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]}) - '
+            f'{ingredient["amount"]}')
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Ингредиент', 'Единица измерения', 'Количество'])
+    for ingredient in ingredients:
+        yield writer.writerow([ingredient['ingredient__name'],
+                               ingredient['ingredient__measurement_unit'],
+                               ingredient['amount']])
+
+
+def render_txt(ingredients):
+    for ingredient in ingredients:
+        yield f'· {format_line(ingredient)}\n'
+
+
+def get_pdf_font():
+    """
+    Регистрирует шрифт с кириллицей из settings.PDF_FONT_PATH.
+
+    Если файла шрифта нет, используется стандартный Helvetica.
+    """
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.PDF_FONT_PATH):
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, settings.PDF_FONT_PATH))
+    return PDF_FONT_NAME
+
+
+def render_pdf(ingredients):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    width, height = A4
+    line_height = PDF_FONT_SIZE * 1.5
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE + 4)
+    pdf.drawString(PDF_MARGIN, y, 'Список покупок')
+    y -= line_height * 2
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for ingredient in ingredients:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, f'• {format_line(ingredient)}')
+        y -= line_height
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_RENDERERS = {
+    'csv': render_csv,
+    'txt': render_txt,
+    'pdf': render_pdf,
+}
+
+
+def export_shopping_cart(user, file_format):
+    """
+    Возвращает содержимое файла списка покупок в формате file_format.
+
+    Готовый файл кэшируется на пользователя с ключом по версии
+    списка покупок, которая меняется при любом изменении корзины
+    или рецептов в ней, поэтому повторное скачивание не обращается
+    к базе данных.
+    """
+    renderer = SHOPPING_CART_RENDERERS[file_format]
+    version = get_version(shopping_cart_version_name(user.pk))
+    key = f'shopping_cart:{user.pk}:{version}:{file_format}'
+    content = cache.get(key)
+    if content is None:
+        content = b''.join(
+            chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+            for chunk in renderer(get_shopping_cart(user).iterator())
+        )
+        cache.set(key, content, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return content
@@ -0,0 +1,43 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import get_version, get_versions
+from users.models import UserSubscription
+
+from .mixins import user_state_version_name
+
+
+def author_recipes_version_name(author_id):
+    """Версия рецептов автора, меняется при публикации и изменении."""
+    return f'author_recipes:{author_id}'
+
+
+def get_following_ids(user):
+    """id авторов, на которых подписан пользователь, с кэшем."""
+    version = get_version(user_state_version_name(user.pk))
+    key = f'following:{user.pk}:{version}'
+    following = cache.get(key)
+    if following is None:
+        following = list(UserSubscription.objects.filter(
+            user=user
+        ).values_list('following', flat=True))
+        cache.set(key, following, settings.FEED_CACHE_TIMEOUT)
+    return following
+
+
+def get_feed_head_key(user, following, path):
+    """
+    Ключ кэша первой страницы ленты.
+
+    Включает версии состояния пользователя и рецептов всех авторов
+    из подписок, поэтому публикация любого из них сбрасывает кэш.
+    """
+    names = [user_state_version_name(user.pk)] + [
+        author_recipes_version_name(author) for author in following
+    ]
+    versions = get_versions(names)
+    state = ','.join(str(versions[name]) for name in names)
+    digest = hashlib.md5(f'{path}:{state}'.encode()).hexdigest()
+    return f'feed:{user.pk}:{digest}'
@@ -0,0 +1,183 @@
+from array import array
+from collections import Counter, defaultdict
+from datetime import timedelta
+from heapq import nsmallest
+from itertools import chain
+from threading import Lock
+
+from django.core.cache import cache
+
+from core.cache import get_version
+from recipes.models import IngredientRecipe, Recipe
+
+RECIPE_INGREDIENTS_VERSION_NAME = 'recipe_ingredients'
+RECIPES_DELETED_VERSION_NAME = 'recipes_deleted'
+
+# Запас при выборке измененных рецептов: транзакция могла записать
+# более раннее время изменения, чем уже прочитанное индексом.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+# Журнал удаленных рецептов в кэше: номер последней записи и записи
+# с id рецептов. Индекс, отставший больше чем на DELETED_LOG_SIZE
+# записей или потерявший запись, перестраивается полностью.
+DELETED_LOG_KEY = 'recipes_deleted:last'
+DELETED_LOG_SIZE = 10000
+DELETED_LOG_TIMEOUT = 24 * 60 * 60
+
+
+def deleted_log_key(number):
+    return f'recipes_deleted:{number}'
+
+
+def log_deleted_recipe(recipe_id):
+    """Добавляет удаленный рецепт в журнал удалений."""
+    cache.add(DELETED_LOG_KEY, 0, None)
+    number = cache.incr(DELETED_LOG_KEY)
+    cache.set(deleted_log_key(number), recipe_id, DELETED_LOG_TIMEOUT)
+
+
+class RecipeIngredientIndex:
+    """
+    Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Номера рецептов и ингредиентов хранятся в массивах array('I').
+    После изменения рецептов индекс дочитывает только рецепты,
+    измененные с момента последнего обновления, а удаленные рецепты
+    берет из журнала удалений в кэше.
+
+    Словари индекса изменяются на месте, а массивы заменяются новыми,
+    поэтому запросы из других потоков видят каждый массив целиком
+    в старой или в новой версии.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.deleted = None
+        self.watermark = None
+        self.data = None
+        self.lock = Lock()
+
+    def read(self, recipes):
+        """Ингредиенты рецептов recipes: {рецепт: array('I')}."""
+        changed = dict(recipes.order_by().values_list('id', 'updated'))
+        if not changed:
+            return {}
+        loaded = {pk: array('I') for pk in changed}
+        rows = IngredientRecipe.objects.filter(
+            recipe__in=recipes.order_by().values('id')
+        ).values_list('recipe', 'ingredient')
+        for recipe, ingredient in rows.iterator():
+            if recipe in loaded:
+                loaded[recipe].append(ingredient)
+        updated = max(changed.values())
+        if self.watermark is None or updated > self.watermark:
+            self.watermark = updated
+        return loaded
+
+    def read_deleted(self, deleted):
+        """
+        Рецепты, удаленные после последнего обновления индекса,
+        или None, если журнал удалений неполон.
+        """
+        if self.deleted is None or deleted < self.deleted:
+            return None
+        if deleted - self.deleted > DELETED_LOG_SIZE:
+            return None
+        keys = [
+            deleted_log_key(number)
+            for number in range(self.deleted + 1, deleted + 1)
+        ]
+        recipes = cache.get_many(keys)
+        if len(recipes) != len(keys):
+            return None
+        return list(recipes.values())
+
+    @staticmethod
+    def apply(data, changed):
+        """
+        Записывает в индекс data ингредиенты рецептов changed,
+        None вместо ингредиентов удаляет рецепт.
+
+        Каждый затронутый массив рецептов ингредиента собирается
+        заново один раз.
+        """
+        recipes, postings = data
+        removed = defaultdict(set)
+        added = defaultdict(list)
+        for recipe, items in changed.items():
+            for ingredient in recipes.get(recipe, ()):
+                removed[ingredient].add(recipe)
+            for ingredient in items or ():
+                added[ingredient].append(recipe)
+        for ingredient in removed.keys() | added.keys():
+            skipped = removed.get(ingredient, ())
+            posting = array('I', (
+                recipe for recipe in postings.get(ingredient, ())
+                if recipe not in skipped
+            ))
+            posting.extend(added.get(ingredient, ()))
+            if posting:
+                postings[ingredient] = posting
+            else:
+                postings.pop(ingredient, None)
+        for recipe, items in changed.items():
+            if items is None:
+                recipes.pop(recipe, None)
+            else:
+                recipes[recipe] = items
+
+    def refresh(self):
+        version = get_version(RECIPE_INGREDIENTS_VERSION_NAME)
+        deleted = cache.get(DELETED_LOG_KEY) or 0
+        if (version, deleted) == (self.version, self.deleted):
+            return self.data
+        with self.lock:
+            if (version, deleted) == (self.version, self.deleted):
+                return self.data
+            removed = self.read_deleted(deleted)
+            if self.data is None or removed is None:
+                self.watermark = None
+                data = ({}, {})
+                self.apply(data, self.read(Recipe.objects.all()))
+                self.data = data
+            else:
+                changed = dict.fromkeys(removed)
+                if version != self.version:
+                    recipes = Recipe.objects.all()
+                    if self.watermark is not None:
+                        recipes = recipes.filter(
+                            updated__gte=self.watermark - REFRESH_OVERLAP
+                        )
+                    changed.update(self.read(recipes))
+                self.apply(self.data, changed)
+            self.version, self.deleted = version, deleted
+        return self.data
+
+    def match(self, ingredients, limit):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает не больше limit кортежей (рецепт, совпало, не хватает):
+        сначала рецепты, для которых есть все ингредиенты, затем
+        с наименьшим числом недостающих.
+        """
+        recipes, postings = self.refresh()
+        matched = Counter(chain.from_iterable(
+            postings.get(ingredient, ()) for ingredient in set(ingredients)
+        ))
+        # Рецепт мог быть удален или изменен другим потоком
+        # после чтения массивов.
+        sizes = {recipe: len(recipes.get(recipe, ())) for recipe in matched}
+        best = nsmallest(
+            limit,
+            ((recipe, count) for recipe, count in matched.items()
+             if sizes[recipe] >= count),
+            key=lambda item: (sizes[item[0]] - item[1],
+                              -item[1],
+                              -item[0])
+        )
+        return [(recipe, count, sizes[recipe] - count)
+                for recipe, count in best]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,137 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from core.cache import get_version
+
+from .relations import get_user_relations
+
+TAGS_VERSION_NAME = 'tags'
+
+# Имена и фамилии пользователей, которые выводятся как авторы рецептов.
+USERS_VERSION_NAME = 'users'
+
+
+def user_state_version_name(user_id):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    return f'user_state:{user_id}'
+
+
+class UserRelationsMixin:
+    """Добавляет в контекст сериализаторов UserRelations запроса."""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['user_relations'] = get_user_relations(context)
+        return context
+
+
+class VersionedCacheMixin:
+    """
+    Кэширует готовые JSON ответы list и retrieve.
+
+    Ключ кэша включает версию набора данных cache_version_name,
+    которая увеличивается сигналами при изменении модели, поэтому
+    устаревшие ответы не отдаются. Ответ содержит ETag, и при
+    совпадении If-None-Match возвращается 304 без тела.
+    """
+    cache_version_name = None
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        version = get_version(self.cache_version_name)
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'response:{self.cache_version_name}:{version}:{path}'
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = JSONRenderer().render(response.data)
+            cached = (f'"{hashlib.md5(body).hexdigest()}"', body)
+            cache.set(key, cached, settings.API_CACHE_TIMEOUT)
+        etag, body = cached
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.API_CACHE_MAX_AGE,
+            must_revalidate=True
+        )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            super().retrieve,
+            *args,
+            **kwargs
+        )
+
+
+class ConditionalGetMixin:
+    """
+    Поддержка условных запросов для list и retrieve.
+
+    Наследник возвращает из get_list_validators и get_object_validators
+    пару (etag, last_modified). Если клиент прислал совпадающие
+    If-None-Match или If-Modified-Since, возвращается 304 без
+    выполнения запроса и сериализации.
+    """
+
+    def get_list_validators(self, request):
+        return None, None
+
+    def get_object_validators(self, request, *args, **kwargs):
+        return None, None
+
+    def conditional_response(self, request, validators, handler,
+                             *args, **kwargs):
+        etag, last_modified = validators
+        if etag is None and last_modified is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_list_validators(request),
+            super().list,
+            *args,
+            **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_object_validators(request, *args, **kwargs),
+            super().retrieve,
+            *args,
+            **kwargs
+        )
@@ -1,6 +1,164 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+MAX_PAGE_SIZE = 100
+
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-created', '-id'),
+    'trending': ('-trending_score', '-created', '-id'),
+}
+DEFAULT_RECIPE_ORDERING = ('-created', '-id')
+# Версия счетчиков избранного и trending_score: они изменяются
+# через update(), не меняя время изменения рецептов.
+RECIPES_RANKING_VERSION_NAME = 'recipes_ranking'
+SEARCH_RECIPE_ORDERING = ('-search_rank', '-created', '-id')
+
+
+def get_recipe_ordering(request, relevance=True):
+    """
+    Сортировка рецептов по параметру ordering=popular|trending.
+
+    Результаты поиска ?search= без ordering сортируются по релевантности,
+    если relevance не выключен.
+    """
+    ordering = request.query_params.get('ordering')
+    if ordering is None and relevance and request.query_params.get('search'):
+        return SEARCH_RECIPE_ORDERING
+    return RECIPE_ORDERINGS.get(ordering, DEFAULT_RECIPE_ORDERING)
+
+
+def get_list_limit(request, default):
+    """Значение параметра limit, но не больше MAX_PAGE_SIZE."""
+    limit = request.query_params.get('limit', '')
+    return min(int(limit) if limit.isdigit() else default, MAX_PAGE_SIZE)
 
 
 class RecipePagination(PageNumberPagination):
     """Погинатор со страницами и лимитом объектов на странице"""
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Погинатор по курсору для бесконечной ленты рецептов.
+
+    Курсор хранит значения всех полей сортировки последнего рецепта
+    страницы, и следующая страница выбирается условием
+    (f1, f2, id) < (v1, v2, id1) без OFFSET и подсчета общего
+    количества. CursorPagination из DRF позиционируется только
+    по первому полю и при большом числе равных значений (например,
+    favorites_count = 0) не может продвинуться дальше.
+    """
+    ordering = DEFAULT_RECIPE_ORDERING
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(ordering, self.cursor.position)
+            )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(position=position)
+
+    def get_keyset_filter(self, ordering, position):
+        """
+        Условие "после position" для сортировки ordering.
+
+        Дополнительное условие по первому полю ограничивает диапазон
+        индекса, по которому выполняется сортировка.
+        """
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                previous.lstrip('-'): value
+                for previous, value in zip(ordering[:index], position)
+            }
+            equal[f'{name}__{lookup}'] = position[index]
+            conditions.append(Q(**equal))
+        first = ordering[0].lstrip('-')
+        bound = 'lte' if ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{first}__{bound}': position[0]}) & reduce(
+            or_,
+            conditions
+        )
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+        return json.dumps(position)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=self.get_position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=True,
+            position=self.get_position(self.page[0])
+        ))
+
+
+def get_recipe_paginator(request):
+    """Погинатор по курсору для ?pagination=cursor, иначе по страницам."""
+    if (request.query_params.get('pagination') == 'cursor'
+            or 'cursor' in request.query_params):
+        paginator = RecipeCursorPagination()
+        paginator.ordering = get_recipe_ordering(request, relevance=False)
+        return paginator
+    return RecipePagination()
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from core.cache import get_version
+from recipes.models import Favorite, Recipe, RecipeSimilarity, ShoppingCart
+
+from .mixins import user_state_version_name
+from .paginators import RECIPE_ORDERINGS
+
+RECOMMENDATIONS_VERSION_NAME = 'recommendations'
+
+
+def get_recommended_ids(user, limit):
+    """
+    id рецептов, рекомендованных пользователю.
+
+    Сходство рецептов из избранного и списка покупок пользователя
+    с соседями из RecipeSimilarity суммируется одним запросом.
+    Если рекомендаций меньше limit, список дополняется популярными
+    сейчас рецептами. Результат кэшируется до изменения избранного
+    или списка покупок пользователя либо пересчета похожих рецептов.
+    """
+    key = (f'recommendations:{user.pk}:'
+           f'{get_version(user_state_version_name(user.pk))}:'
+           f'{get_version(RECOMMENDATIONS_VERSION_NAME)}:{limit}')
+    recipe_ids = cache.get(key)
+    if recipe_ids is not None:
+        return recipe_ids
+    favorites = Favorite.objects.filter(user=user).values('recipe')
+    cart = ShoppingCart.objects.filter(user=user).values('recipe')
+    recipe_ids = list(RecipeSimilarity.objects.filter(
+        recipe__in=favorites.union(cart)
+    ).exclude(
+        similar__in=favorites
+    ).exclude(
+        similar__in=cart
+    ).values('similar').annotate(
+        total=Sum('score')
+    ).order_by('-total', 'similar').values_list('similar', flat=True)[:limit])
+    if len(recipe_ids) < limit:
+        recipe_ids += Recipe.objects.exclude(
+            pk__in=recipe_ids
+        ).exclude(
+            pk__in=favorites
+        ).exclude(
+            pk__in=cart
+        ).order_by(
+            *RECIPE_ORDERINGS['trending']
+        ).values_list('pk', flat=True)[:limit - len(recipe_ids)]
+    cache.set(key, recipe_ids, settings.RECOMMENDATION_CACHE_TIMEOUT)
+    return recipe_ids
@@ -0,0 +1,54 @@
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import UserSubscription
+
+
+class UserRelations:
+    """
+    Избранное, список покупок и подписки пользователя запроса.
+
+    Каждое множество id загружается одним запросом при первом
+    обращении, после чего поля is_* сериализаторов проверяют
+    вхождение без запросов к базе данных.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _ids(self, model, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(model.objects.filter(
+            user=self.user
+        ).values_list(field, flat=True))
+
+    @cached_property
+    def favorites(self):
+        return self._ids(Favorite, 'recipe')
+
+    @cached_property
+    def shopping_cart(self):
+        return self._ids(ShoppingCart, 'recipe')
+
+    @cached_property
+    def following(self):
+        return self._ids(UserSubscription, 'following')
+
+
+def get_user_relations(context):
+    """
+    UserRelations из контекста сериализатора.
+
+    Если вьюсет не добавил их в контекст, они создаются один раз
+    на запрос и сохраняются в самом запросе.
+    """
+    relations = context.get('user_relations')
+    if relations is not None:
+        return relations
+    request = context['request']
+    relations = getattr(request, 'user_relations', None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request.user_relations = relations
+    return relations
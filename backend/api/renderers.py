@@ -0,0 +1,54 @@
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+
+class FileRenderer(BaseRenderer):
+    """
+    Рендерер готовых файлов: отдает байты без изменений.
+
+    Ошибки (например, 401) сериализуются в JSON в кодировке utf-8,
+    в том числе для двоичных форматов без charset.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class TxtRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(FileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class FileContentNegotiation(DefaultContentNegotiation):
+    """
+    Выбор рендерера файла только по параметру format.
+
+    Заголовок Accept не учитывается, поэтому клиент, присылающий
+    Accept: application/json, получает файл, а не 406. Без format
+    используется первый рендерер.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        file_format = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if file_format:
+            renderers = self.filter_renderers(renderers, file_format)
+        renderer = renderers[0]
+        return renderer, renderer.media_type
@@ -1,15 +1,26 @@
-import base64
 import re
 
-from django.core.files.base import ContentFile
-from django.db.models import F
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag, TagRecipe)
-from users.models import User, UserSubscription
+from core.images import ImageDecodeError, decode_base64_image, variant_name
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe
+from users.models import User
+
+from .relations import get_user_relations
+
+# Действия вьюсетов, которые отдают списки рецептов.
+LIST_ACTIONS = ('list', 'match', 'recommended', 'feed')
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None, если он не задан."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -34,12 +45,9 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if not self.context['request'].user.is_authenticated:
-            return False
-        return UserSubscription.objects.filter(
-            user=self.context['request'].user,
-            following=obj.id
-        ).exists()
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
+        return obj.id in get_user_relations(self.context).following
 
 
 class UserRegistrationSerializer(UserCreateSerializer):
@@ -87,7 +95,6 @@ class UserSubscribeSerializer(serializers.ModelSerializer):
     """
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -107,22 +114,24 @@ class UserSubscribeSerializer(serializers.ModelSerializer):
                             'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        return UserSubscription.objects.filter(
-            user=self.context.userr,
-            following=obj.id
-        ).exists()
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
+        return obj.id in get_user_relations(self.context).following
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.query_params.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.id).all()
-        if recipes_limit is not None:
-            recipes = recipes[:int(recipes_limit)]
-        serializer = FavoriteRecipeSerializer(recipes, many=True)
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = Recipe.objects.filter(author=obj.id)
+            recipes_limit = get_recipes_limit(self.context['request'])
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+        serializer = FavoriteRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.context
+        )
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=self.context.user).count()
-
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тэгов для рецептов."""
@@ -140,14 +149,65 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class Base64ImageField(serializers.ImageField):
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиента рецепта с количеством."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = IngredientRecipe
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ImageVariantField(serializers.ImageField):
+    """
+    Изображение рецепта, отдающее ссылку на уменьшенную копию.
+
+    variant -- размер копии (list или detail); если не задан,
+    для списка рецептов берется list, иначе detail.
+    image_format -- jpeg или webp.
+    Пока копии не созданы, отдается ссылка на оригинал.
+    """
+
+    def __init__(self, variant=None, image_format='jpeg', **kwargs):
+        self.variant = variant
+        self.image_format = image_format
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get('view')
+        if getattr(view, 'action', None) in LIST_ACTIONS:
+            return 'list'
+        return 'detail'
+
+    def to_representation(self, value):
+        if not value or not getattr(value.instance, 'image_processed', False):
+            return super().to_representation(value)
+        url = value.storage.url(variant_name(
+            value.name,
+            self.get_variant(),
+            self.image_format
+        ))
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class Base64ImageField(ImageVariantField):
     """Сериализатор для изображений base64."""
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_image(data)
+            except ImageDecodeError as error:
+                raise ValidationError(str(error))
         return super().to_internal_value(data)
 
 
@@ -169,6 +229,11 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_webp = ImageVariantField(
+        source='image',
+        image_format='webp',
+        read_only=True
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -183,6 +248,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_webp',
             'text',
             'cooking_time'
         )
@@ -192,28 +258,20 @@ class RecipeSerializer(serializers.ModelSerializer):
                             'id')
 
     def get_is_favorited(self, obj):
-        if not self.context['request'].user.is_authenticated:
-            return False
-        return Favorite.objects.filter(
-            user=self.context['request'].user,
-            recipe=obj.id
-        ).exists()
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
+        return obj.id in get_user_relations(self.context).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        if not self.context['request'].user.is_authenticated:
-            return False
-        return ShoppingCart.objects.filter(
-            user=self.context['request'].user,
-            recipe=obj.id
-        ).exists()
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
+        return obj.id in get_user_relations(self.context).shopping_cart
 
     def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientrecipe__amount')
-        )
+        amounts = getattr(obj, 'ingredient_amounts', None)
+        if amounts is None:
+            amounts = obj.ingredientrecipe_set.select_related('ingredient')
+        return IngredientAmountSerializer(amounts, many=True).data
 
 
 class IngredientCreateSerializer(serializers.ModelSerializer):
@@ -264,60 +322,107 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                                       context=self.context)
         return serializer.data
 
+    def validate(self, attrs):
+        errors = {}
+        if 'tags' in attrs:
+            tags = Tag.objects.in_bulk(set(attrs['tags']))
+            unknown = sorted(set(attrs['tags']) - tags.keys())
+            if unknown:
+                errors['tags'] = f'Теги не найдены: {unknown}'
+            elif len(tags) != len(attrs['tags']):
+                errors['tags'] = 'Теги не должны повторяться'
+            attrs['tags'] = [tags.get(pk) for pk in attrs['tags']]
+        if 'ingredients' in attrs:
+            ingredient_ids = {item['id'] for item in attrs['ingredients']}
+            ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+            unknown = sorted(ingredient_ids - ingredients.keys())
+            if unknown:
+                errors['ingredients'] = f'Ингредиенты не найдены: {unknown}'
+            elif len(ingredient_ids) != len(attrs['ingredients']):
+                errors['ingredients'] = 'Ингредиенты не должны повторяться'
+            for item in attrs['ingredients']:
+                item['ingredient'] = ingredients.get(item['id'])
+        if errors:
+            raise ValidationError(errors)
+        return attrs
+
+    def set_tags(self, recipe, tags):
+        TagRecipe.objects.bulk_create(
+            TagRecipe(tag=tag, recipe=recipe) for tag in tags
+        )
+
+    def set_ingredients(self, recipe, ingredients):
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                ingredient=item['ingredient'],
+                recipe=recipe,
+                amount=item['amount']
+            )
+            for item in ingredients
+        )
+
+    def update_tags(self, recipe, tags):
+        current = set(TagRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        tags = {tag.pk: tag for tag in tags}
+        removed = current - tags.keys()
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe,
+                tag_id__in=removed
+            ).delete()
+        self.set_tags(
+            recipe,
+            (tag for pk, tag in tags.items() if pk not in current)
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        ingredients = {item['id']: item for item in ingredients}
+        removed = current.keys() - ingredients.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for pk, item in ingredients.items():
+            row = current.get(pk)
+            if row is not None and row.amount != item['amount']:
+                row.amount = item['amount']
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        self.set_ingredients(
+            recipe,
+            (item for pk, item in ingredients.items() if pk not in current)
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        tag_data = []
-        ingredient_data = []
-        for tag in tags:
-            current_tag = Tag.objects.get(
-                pk=tag
-            )
-            tag_data.append(
-                TagRecipe(tag=current_tag, recipe=recipe)
-            )
-        for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(
-                pk=ingredient['id']
-            )
-            ingredient_data.append(IngredientRecipe(
-                ingredient=current_ingredient,
-                recipe=recipe,
-                amount=ingredient['amount']
-            ))
-        TagRecipe.objects.bulk_create(tag_data)
-        IngredientRecipe.objects.bulk_create(ingredient_data)
+        self.set_tags(recipe, tags)
+        self.set_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        instance.ingredients.clear()
-        tags = validated_data.pop('tags')
-        tag_data = []
-        ingredient_data = []
-        for tag in tags:
-            current_tag = Tag.objects.get(
-                pk=tag
-            )
-            tag_data.append(
-                TagRecipe(tag=current_tag, recipe=instance)
-            )
-        ingredients = validated_data.pop('ingredients')
-        for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(
-                pk=ingredient['id']
-            )
-            ingredient_data.append(IngredientRecipe(
-                ingredient=current_ingredient,
-                recipe=instance,
-                amount=ingredient['amount']
-            ))
-        TagRecipe.objects.bulk_create(tag_data)
-        IngredientRecipe.objects.bulk_create(ingredient_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
-        instance.image = validated_data.get('image', instance.image)
+        if 'image' in validated_data:
+            instance.image = validated_data['image']
         instance.cooking_time = validated_data.get(
             'cooking_time',
             instance.cooking_time
@@ -326,12 +431,37 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return instance
 
 
+class RecipeMatchSerializer(RecipeSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам.
+    Дополнительные поля:
+    matched_ingredients -- сколько ингредиентов рецепта есть
+    missing_ingredients -- сколько ингредиентов рецепта не хватает.
+    """
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_ingredients',
+            'missing_ingredients'
+        )
+
+
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор с основной информацией по рецепту."""
+    image = ImageVariantField(variant='list', read_only=True)
+    image_webp = ImageVariantField(
+        source='image',
+        variant='list',
+        image_format='webp',
+        read_only=True
+    )
 
     class Meta:
         model = Recipe
         fields = ('id',
                   'name',
                   'image',
+                  'image_webp',
                   'cooking_time')
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import bump_version
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User, UserSubscription
+
+from .autocomplete import INGREDIENTS_VERSION_NAME
+from .exporters import shopping_cart_version_name
+from .feed import author_recipes_version_name
+from .matching import (RECIPE_INGREDIENTS_VERSION_NAME,
+                       RECIPES_DELETED_VERSION_NAME, log_deleted_recipe)
+from .mixins import (TAGS_VERSION_NAME, USERS_VERSION_NAME,
+                     user_state_version_name)
+from .paginators import RECIPES_RANKING_VERSION_NAME
+
+# Поля пользователя, которые выводятся вместе с его рецептами.
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(
+        shopping_cart_version_name(instance.user_id)
+    ))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    users = list(ShoppingCart.objects.filter(
+        recipe=instance
+    ).values_list('user', flat=True))
+
+    def bump_shopping_carts():
+        for user in users:
+            bump_version(shopping_cart_version_name(user))
+    transaction.on_commit(bump_shopping_carts)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_ingredients_changed(sender, **kwargs):
+    transaction.on_commit(
+        lambda: bump_version(RECIPE_INGREDIENTS_VERSION_NAME)
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def author_recipes_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(
+        author_recipes_version_name(instance.author_id)
+    ))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # После удаления pk объекта обнуляется, поэтому он сохраняется здесь.
+    recipe_id = instance.pk
+
+    def log_deleted():
+        log_deleted_recipe(recipe_id)
+        bump_version(RECIPES_DELETED_VERSION_NAME)
+    transaction.on_commit(log_deleted)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorites_count_changed(sender, **kwargs):
+    if kwargs.get('created', True):
+        transaction.on_commit(
+            lambda: bump_version(RECIPES_RANKING_VERSION_NAME)
+        )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version(INGREDIENTS_VERSION_NAME)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version(TAGS_VERSION_NAME)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, update_fields, **kwargs):
+    if update_fields is None or USER_PUBLIC_FIELDS & set(update_fields):
+        bump_version(USERS_VERSION_NAME)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=UserSubscription)
+def user_state_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(
+        user_state_version_name(instance.user_id)
+    ))
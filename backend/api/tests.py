@@ -0,0 +1,1052 @@
+import asyncio
+import base64
+import io
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Prefetch
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.test import (APIRequestFactory, APITestCase,
+                                 force_authenticate)
+
+from api import async_views
+from api.matching import (DELETED_LOG_KEY, RecipeIngredientIndex,
+                          deleted_log_key)
+from api.paginators import DEFAULT_RECIPE_ORDERING, RECIPE_ORDERINGS
+from api.serializers import RecipeSerializer, UserSerializer
+from core.images import (get_executor, process_recipe_image, submit,
+                         variant_names)
+from core.management.commands import update_recommendations
+from core.middleware import (QueryInstrumentationMiddleware, QueryRecorder,
+                             install_recorder, record_current, record_queries)
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            RecipeSimilarity, ShoppingCart, Tag, TagRecipe,
+                            TrendingState)
+from users.models import User, UserSubscription
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class RecipeAPITestCase(APITestCase):
+    """Пользователи, теги, ингредиенты и рецепты для тестов API."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com'
+        )
+        cls.authors = [
+            User.objects.create(
+                username=f'author{index}',
+                email=f'author{index}@example.com'
+            )
+            for index in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тег {index}',
+                color='#E26C2D',
+                slug=f'tag{index}'
+            )
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}',
+                measurement_unit='г'
+            )
+            for index in range(10)
+        ]
+        cls.recipes = []
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/images/test.jpg',
+                author=cls.authors[index % len(cls.authors)]
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag=tag)
+                for tag in cls.tags[:index % 3 + 1]
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=index + 1
+                )
+                for ingredient in cls.ingredients[index % 5:index % 5 + 4]
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        UserSubscription.objects.create(
+            user=cls.user,
+            following=cls.authors[0]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeQueryCountTest(RecipeAPITestCase):
+    """Количество запросов списка и рецепта не зависит от их размера."""
+
+    # Проверка ETag, количество, страница, автор, теги и ингредиенты.
+    LIST_QUERIES = 6
+    # Проверка ETag, рецепт, автор, теги и ингредиенты.
+    DETAIL_QUERIES = 5
+
+    def test_list_query_count(self):
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = self.client.get(
+                        '/api/recipes/',
+                        {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_flags(self):
+        response = self.client.get('/api/recipes/', {'limit': 12})
+        favorites = set(Favorite.objects.filter(
+            user=self.user
+        ).values_list('recipe', flat=True))
+        for recipe in response.data['results']:
+            self.assertEqual(recipe['is_favorited'], recipe['id'] in favorites)
+            self.assertEqual(
+                recipe['is_in_shopping_cart'],
+                recipe['id'] in favorites
+            )
+
+    def test_retrieve_query_count(self):
+        for recipe in (self.recipes[0], self.recipes[4]):
+            with self.subTest(recipe=recipe.pk):
+                with self.assertNumQueries(self.DETAIL_QUERIES):
+                    response = self.client.get(f'/api/recipes/{recipe.pk}/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.data['ingredients']),
+                    recipe.ingredients.count()
+                )
+
+
+class RelationEndpointsTest(RecipeAPITestCase):
+    """Повторное добавление и удаление связей отвечают 400."""
+
+    def assert_add_remove(self, url, model, **lookup):
+        self.assertFalse(model.objects.filter(**lookup).exists())
+        self.assertEqual(self.client.post(url).status_code, 201)
+        # Повторное добавление не создает записи и не нарушает
+        # ограничение уникальности.
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(model.objects.filter(**lookup).count(), 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertFalse(model.objects.filter(**lookup).exists())
+
+    def test_favorite(self):
+        recipe = self.recipes[1]
+        self.assert_add_remove(
+            f'/api/recipes/{recipe.pk}/favorite/',
+            Favorite,
+            user=self.user,
+            recipe=recipe
+        )
+
+    def test_shopping_cart(self):
+        recipe = self.recipes[1]
+        self.assert_add_remove(
+            f'/api/recipes/{recipe.pk}/shopping_cart/',
+            ShoppingCart,
+            user=self.user,
+            recipe=recipe
+        )
+
+    def test_subscribe(self):
+        author = self.authors[1]
+        self.assert_add_remove(
+            f'/api/users/{author.pk}/subscribe/',
+            UserSubscription,
+            user=self.user,
+            following=author
+        )
+
+    def test_subscribe_to_self(self):
+        url = f'/api/users/{self.user.pk}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertFalse(
+            UserSubscription.objects.filter(following=self.user).exists()
+        )
+
+    def test_missing_recipe(self):
+        for action in ('favorite', 'shopping_cart'):
+            with self.subTest(action=action):
+                response = self.client.post(f'/api/recipes/0/{action}/')
+                self.assertEqual(response.status_code, 404)
+
+
+class UserSubscriptionsTest(RecipeAPITestCase):
+    """Подписки с рецептами авторов за постоянное число запросов."""
+
+    URL = '/api/users/subscriptions/'
+
+    # Количество подписок, страница авторов и их рецепты.
+    QUERIES = 3
+
+    def test_query_count(self):
+        for authors in (self.authors[:1], self.authors):
+            UserSubscription.objects.bulk_create(
+                UserSubscription(user=self.user, following=author)
+                for author in authors[1:]
+            )
+            with self.subTest(authors=len(authors)):
+                with self.assertNumQueries(self.QUERIES):
+                    response = self.client.get(self.URL)
+                self.assertEqual(response.data['count'], len(authors))
+
+    def test_recipes_limit(self):
+        UserSubscription.objects.bulk_create(
+            UserSubscription(user=self.user, following=author)
+            for author in self.authors[1:]
+        )
+        with self.assertNumQueries(self.QUERIES):
+            response = self.client.get(self.URL, {'recipes_limit': 2})
+        for author in response.data['results']:
+            recipes = Recipe.objects.filter(author=author['id'])
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.values_list('pk', flat=True)[:2])
+            )
+            self.assertEqual(author['recipes_count'], recipes.count())
+            self.assertTrue(author['is_subscribed'])
+
+
+class UserRelationsTest(RecipeAPITestCase):
+    """
+    Сериализаторы с обычным контекстом загружают избранное, список
+    покупок и подписки одним запросом на каждое множество.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.request = APIRequestFactory().get('/api/recipes/')
+        self.request.user = self.user
+
+    def test_recipes(self):
+        for count in (2, 12):
+            with self.subTest(count=count):
+                recipes = list(Recipe.objects.select_related(
+                    'author'
+                ).prefetch_related('tags', Prefetch(
+                    'ingredientrecipe_set',
+                    IngredientRecipe.objects.select_related('ingredient'),
+                    to_attr='ingredient_amounts'
+                )).order_by('pk')[:count])
+                serializer = RecipeSerializer(
+                    recipes,
+                    many=True,
+                    context={'request': self.request}
+                )
+                # Избранное, список покупок и подписки.
+                with self.assertNumQueries(3):
+                    data = serializer.data
+                self.request.user_relations = None
+                self.assertEqual(
+                    [recipe['is_favorited'] for recipe in data],
+                    [index % 2 == 0 for index in range(count)]
+                )
+                self.assertEqual(
+                    [recipe['author']['is_subscribed'] for recipe in data],
+                    [index % 3 == 0 for index in range(count)]
+                )
+
+    def test_users(self):
+        users = list(User.objects.order_by('pk'))
+        serializer = UserSerializer(
+            users,
+            many=True,
+            context={'request': self.request}
+        )
+        with self.assertNumQueries(1):
+            data = serializer.data
+        self.assertEqual(
+            [user['id'] for user in data if user['is_subscribed']],
+            [self.authors[0].pk]
+        )
+
+
+class RecipeCursorPaginationTest(RecipeAPITestCase):
+    """Лента по курсору проходит все рецепты при равных значениях."""
+
+    def setUp(self):
+        super().setUp()
+        # Одинаковые created и счетчики: позиция определяется только
+        # сочетанием всех полей сортировки.
+        Recipe.objects.update(created=self.recipes[0].created)
+
+    def walk(self, url, link):
+        ids = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data[link]
+        return ids
+
+    def test_walk(self):
+        for ordering, fields in (('', DEFAULT_RECIPE_ORDERING),
+                                 *RECIPE_ORDERINGS.items()):
+            with self.subTest(ordering=ordering):
+                expected = list(Recipe.objects.order_by(
+                    *fields
+                ).values_list('pk', flat=True))
+                pages = self.walk(
+                    f'/api/recipes/?pagination=cursor&limit=5'
+                    f'&ordering={ordering}',
+                    'next'
+                )
+                self.assertEqual(sum(pages, []), expected)
+                self.assertEqual([len(page) for page in pages], [5, 5, 2])
+
+    def test_walk_back(self):
+        url = '/api/recipes/?pagination=cursor&limit=5&ordering=popular'
+        for _ in range(2):
+            url = self.client.get(url).data['next']
+        pages = self.walk(url, 'previous')
+        expected = list(Recipe.objects.order_by(
+            *RECIPE_ORDERINGS['popular']
+        ).values_list('pk', flat=True))
+        self.assertEqual(sum(reversed(pages), []), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeConditionalGetTest(RecipeAPITestCase):
+    """ETag и Last-Modified меняются вместе с данными ответа."""
+
+    def assert_changed(self, url, change):
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            304
+        )
+        # Версии кэша - время изменения, изменение через 5 секунд
+        # должно сдвинуть и Last-Modified.
+        later = time.time_ns() + 5 * 10 ** 9
+        with mock.patch('core.cache.time.time_ns', return_value=later):
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            200
+        )
+        self.assertEqual(self.client.get(
+            url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        ).status_code, 200)
+
+    def test_tag_changed(self):
+        def change():
+            self.tags[0].name = 'новый тег'
+            self.tags[0].save()
+        self.assert_changed(f'/api/recipes/{self.recipes[0].pk}/', change)
+
+    def test_ingredient_changed(self):
+        def change():
+            self.ingredients[0].name = 'новый ингредиент'
+            self.ingredients[0].save()
+        self.assert_changed('/api/recipes/', change)
+
+    def test_author_changed(self):
+        def change():
+            self.authors[0].first_name = 'Новое имя'
+            self.authors[0].save()
+        self.assert_changed(f'/api/recipes/{self.recipes[0].pk}/', change)
+
+    def test_recipe_deleted(self):
+        self.assert_changed('/api/recipes/', self.recipes[5].delete)
+
+    def test_favorites_ranking_changed(self):
+        def change():
+            for user in self.authors:
+                Favorite.objects.create(user=user, recipe=self.recipes[1])
+        self.assert_changed('/api/recipes/?ordering=popular', change)
+
+    def test_trending_ranking_changed(self):
+        def change():
+            call_command('update_trending', stdout=io.StringIO())
+        self.assert_changed('/api/recipes/?ordering=trending', change)
+
+    def test_last_login_ignored(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        etag = self.client.get(url)['ETag']
+        self.authors[0].save(update_fields=['last_login'])
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            304
+        )
+
+
+class SubscriptionFeedTest(RecipeAPITestCase):
+    """Лента рецептов авторов из подписок и кэш ее первой страницы."""
+
+    URL = '/api/recipes/feed/'
+
+    def feed_ids(self):
+        response = self.client.get(self.URL, {'limit': 20})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def expected_ids(self, *authors):
+        return list(Recipe.objects.filter(
+            author__in=authors
+        ).order_by('-created', '-id').values_list('pk', flat=True))
+
+    def test_feed(self):
+        self.assertEqual(self.feed_ids(), self.expected_ids(self.authors[0]))
+        response = self.client.get(self.URL, {'limit': 2})
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']
+             + next_page.data['results']],
+            self.expected_ids(self.authors[0])[:4]
+        )
+
+    def test_head_cached(self):
+        expected = self.feed_ids()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.feed_ids(), expected)
+
+    def test_new_recipe(self):
+        self.feed_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='Новый рецепт',
+                text='Описание',
+                cooking_time=10,
+                author=self.authors[0]
+            )
+        self.assertEqual(self.feed_ids()[0], recipe.pk)
+
+    def test_follow_and_unfollow(self):
+        self.feed_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/users/{self.authors[1].pk}/subscribe/'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.feed_ids(),
+            self.expected_ids(self.authors[0], self.authors[1])
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f'/api/users/{self.authors[0].pk}/subscribe/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.feed_ids(), self.expected_ids(self.authors[1]))
+
+
+class ShoppingCartDownloadTest(RecipeAPITestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    def test_formats(self):
+        for file_format, content_type in (('txt', 'text/plain'),
+                                          ('csv', 'text/csv'),
+                                          ('pdf', 'application/pdf')):
+            with self.subTest(file_format=file_format):
+                response = self.client.get(self.URL, {'format': file_format})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(
+                    response['Content-Type'].startswith(content_type)
+                )
+
+    def test_accept_header_ignored(self):
+        response = self.client.get(self.URL, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_anonymous_error(self):
+        self.client.force_authenticate(None)
+        for file_format in ('txt', 'pdf'):
+            with self.subTest(file_format=file_format):
+                response = self.client.get(self.URL, {'format': file_format})
+                self.assertEqual(response.status_code, 401)
+
+    def test_unknown_format(self):
+        response = self.client.get(self.URL, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalidated_after_commit(self):
+        content = self.client.get(self.URL).content
+        with self.captureOnCommitCallbacks() as callbacks:
+            ShoppingCart.objects.create(
+                user=self.user,
+                recipe=self.recipes[5]
+            )
+            # До фиксации транзакции файл берется из кэша.
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.URL).content, content)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.client.get(self.URL).content, content)
+
+
+def image_data(color=(200, 100, 50)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 16), color).save(buffer, 'png')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class RecipeWriteTest(RecipeAPITestCase):
+    """Теги и ингредиенты рецепта проверяются и пишутся пачкой."""
+
+    # Автор, теги, ингредиенты, транзакция, рецепт, счетчик автора,
+    # TagRecipe, IngredientRecipe и ответ: теги, ингредиенты, подписки,
+    # избранное и список покупок.
+    CREATE_QUERIES = 14
+    # Рецепт, автор, теги, ингредиенты, транзакция, текущие, удаленные
+    # и добавленные теги и ингредиенты, рецепт, списки покупок и ответ:
+    # теги, подписки, ингредиенты.
+    UPDATE_QUERIES = 17
+
+    def recipe_data(self, ingredients, tags):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': image_data(),
+            'tags': [tag.pk for tag in tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_create_query_count(self):
+        for count in (2, 8):
+            with self.subTest(count=count):
+                data = self.recipe_data(
+                    self.ingredients[:count],
+                    self.tags[:count % 3 + 1]
+                )
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        data,
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_update_query_count(self):
+        # Оба рецепта с одним тегом, ингредиенты и теги заменяются целиком.
+        for recipe, count in ((self.recipes[0], 2), (self.recipes[6], 5)):
+            with self.subTest(count=count):
+                self.client.force_authenticate(recipe.author)
+                ingredients = self.ingredients[5:5 + count]
+                data = self.recipe_data(ingredients, self.tags[1:])
+                del data['image']
+                with self.assertNumQueries(self.UPDATE_QUERIES):
+                    response = self.client.patch(
+                        f'/api/recipes/{recipe.pk}/',
+                        data,
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    sorted(item['id']
+                           for item in response.data['ingredients']),
+                    [ingredient.pk for ingredient in ingredients]
+                )
+
+    def test_unknown_ids(self):
+        data = self.recipe_data(self.ingredients[:2], self.tags[:1])
+        data['tags'] += [1000, 1001]
+        data['ingredients'] += [{'id': 2000, 'amount': 1},
+                                {'id': 2001, 'amount': 1}]
+        # Автор, теги и ингредиенты.
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1000, 1001', str(response.data['tags']))
+        self.assertIn('2000, 2001', str(response.data['ingredients']))
+        self.assertFalse(Recipe.objects.filter(name='Новый рецепт').exists())
+
+
+class ProtectedFieldsTest(RecipeAPITestCase):
+    """Сохранение загруженного объекта не затирает счетчики в базе."""
+
+    def test_recipe_counters_kept(self):
+        recipe = Recipe.objects.get(pk=self.recipes[1].pk)
+        Favorite.objects.create(user=self.authors[0], recipe=recipe)
+        ShoppingCart.objects.create(user=self.authors[0], recipe=recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(trending_score=2.5)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.cart_count, recipe.trending_score),
+            (1, 1, 2.5)
+        )
+
+    def test_user_counters_kept(self):
+        author = User.objects.get(pk=self.authors[1].pk)
+        UserSubscription.objects.create(user=self.user, following=author)
+        author.first_name = 'Имя'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Имя')
+        self.assertEqual(author.followers_count, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Поиск по search_vector')
+class RecipeSearchTest(RecipeAPITestCase):
+    """search_vector обновляется при любом изменении рецепта."""
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_api_create(self):
+        ingredient = Ingredient.objects.create(
+            name='картофель',
+            measurement_unit='г'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Пюре',
+                'text': 'Описание',
+                'cooking_time': 15,
+                'image': image_data(),
+                'tags': [self.tags[0].pk],
+                'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.search('картофеля'), [response.data['id']])
+
+    def test_model_save(self):
+        recipe = self.recipes[3]
+        recipe.text = 'Запеканка из творога'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.search('творог'), [recipe.pk])
+
+    def test_ingredient_renamed(self):
+        ingredient = self.ingredients[6]
+        ingredient.name = 'шпинат'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        self.assertEqual(
+            sorted(self.search('шпинат')),
+            sorted(recipe.pk for recipe in ingredient.recipe_set.all())
+        )
+
+
+class RecipeIngredientIndexTest(RecipeAPITestCase):
+    """Индекс подбора обновляется без перестроения."""
+
+    def setUp(self):
+        super().setUp()
+        self.index = RecipeIngredientIndex()
+        self.search = self.ingredients[:3]
+
+    def assert_matched(self):
+        matched = self.index.match([item.pk for item in self.search], 100)
+        self.assertEqual(
+            {recipe for recipe, _, _ in matched},
+            set(Recipe.objects.filter(
+                ingredients__in=self.search
+            ).values_list('pk', flat=True))
+        )
+
+    def test_deleted(self):
+        self.assert_matched()
+        data = self.index.data
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].delete()
+            self.authors[1].delete()
+        self.assert_matched()
+        self.assertIs(self.index.data, data)
+
+    def test_ingredients_changed(self):
+        self.assert_matched()
+        data = self.index.data
+        recipe = self.recipes[5]
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.filter(recipe=recipe).delete()
+            IngredientRecipe.objects.create(
+                recipe=recipe,
+                ingredient=self.ingredients[9],
+                amount=1
+            )
+            recipe.save()
+        self.assert_matched()
+        self.assertIs(self.index.data, data)
+
+    def test_lost_log(self):
+        self.assert_matched()
+        data = self.index.data
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].delete()
+            self.recipes[1].delete()
+        cache.delete(deleted_log_key(cache.get(DELETED_LOG_KEY)))
+        self.assert_matched()
+        self.assertIsNot(self.index.data, data)
+
+
+class UpdateTrendingTest(RecipeAPITestCase):
+    """Повторный пересчет продолжает с сохраненного в базе времени."""
+
+    def scores(self):
+        return dict(Recipe.objects.filter(
+            trending_score__gt=0
+        ).values_list('pk', 'trending_score'))
+
+    def test_incremental(self):
+        call_command('update_trending', stdout=io.StringIO())
+        first = self.scores()
+        self.assertEqual(
+            set(first),
+            {recipe.pk for recipe in self.recipes[::2]}
+        )
+        computed = TrendingState.objects.get().computed
+        # Кэш другого процесса пуст, время берется из базы данных.
+        cache.clear()
+        call_command('update_trending', stdout=io.StringIO())
+        second = self.scores()
+        self.assertEqual(set(second), set(first))
+        for pk, score in second.items():
+            self.assertLessEqual(score, first[pk])
+            self.assertAlmostEqual(score, first[pk], places=3)
+        self.assertGreater(TrendingState.objects.get().computed, computed)
+
+
+class UpdateRecommendationsTest(RecipeAPITestCase):
+    """Похожие рецепты сохраняются пачками без изменения результата."""
+
+    def similarities(self):
+        call_command('update_recommendations', stdout=io.StringIO())
+        return list(RecipeSimilarity.objects.order_by(
+            'recipe',
+            '-score',
+            'similar'
+        ).values_list('recipe', 'similar', 'score'))
+
+    def test_batches(self):
+        Favorite.objects.bulk_create(
+            Favorite(user=author, recipe=recipe)
+            for author in self.authors
+            for recipe in self.recipes[1::3]
+        )
+        expected = self.similarities()
+        self.assertTrue(expected)
+        with mock.patch.object(update_recommendations, 'BATCH_SIZE', 7):
+            self.assertEqual(self.similarities(), expected)
+        recipe = self.recipes[1].pk
+        self.assertNotIn(recipe, [
+            similar for pk, similar, _ in expected if pk == recipe
+        ])
+
+
+class RecipeImageTest(RecipeAPITestCase):
+    """Уменьшенные копии создаются и удаляются вместе с изображением."""
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Рецепт с изображением',
+                'text': 'Описание',
+                'cooking_time': 15,
+                'image': image_data(),
+                'tags': [self.tags[0].pk],
+                'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def assert_variants(self, name, exist):
+        for variant in variant_names(name):
+            self.assertEqual(default_storage.exists(variant), exist, variant)
+
+    def test_replace_image(self):
+        recipe = self.create_recipe()
+        self.assertTrue(recipe.image_processed)
+        self.assert_variants(recipe.image.name, True)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'image': image_data((0, 0, 0))},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        updated = Recipe.objects.get(pk=recipe.pk)
+        self.assertNotEqual(updated.image.name, recipe.image.name)
+        self.assertTrue(updated.image_processed)
+        self.assert_variants(recipe.image.name, False)
+        self.assert_variants(updated.image.name, True)
+
+    def test_delete_recipe(self):
+        recipe = self.create_recipe()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_variants(recipe.image.name, False)
+
+    def test_shared_image_kept(self):
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(
+            image=recipe.image.name
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assert_variants(recipe.image.name, True)
+
+    @override_settings(IMAGE_PROCESSING_WORKERS=1)
+    def test_worker_error_logged(self):
+        get_executor.cache_clear()
+        self.addCleanup(get_executor.cache_clear)
+        with self.assertLogs('foodgram.images', 'ERROR') as logs:
+            submit(process_recipe_image, 'missing')
+            # Единственный поток пула вызывает callback первой задачи
+            # до того, как возьмет вторую.
+            get_executor().submit(int).result()
+        self.assertIn('process_recipe_image', logs.output[0])
+
+
+class VersionedCacheTest(RecipeAPITestCase):
+    """Ответы тегов и ингредиентов кэшируются до изменения справочника."""
+
+    def assert_cached(self, url, change, changed_name):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, response.content)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                304
+            )
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(changed_name, response.content.decode())
+
+    def test_tags(self):
+        def change():
+            self.tags[0].name = 'новый тег'
+            self.tags[0].save()
+        self.assert_cached('/api/tags/', change, 'новый тег')
+
+    def test_ingredients(self):
+        for max_size in (100, 0):
+            name = f'ингредиент новый {max_size}'
+
+            def change():
+                self.ingredients[0].name = name
+                self.ingredients[0].save()
+            with self.subTest(max_size=max_size):
+                with self.settings(INGREDIENT_INDEX_MAX_SIZE=max_size):
+                    self.assert_cached(
+                        '/api/ingredients/?name=ингр',
+                        change,
+                        name
+                    )
+
+
+class IngredientSearchTest(APITestCase):
+    """Поиск ингредиентов в памяти и в базе данных дает один результат."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Ёжевика', 'ежевичный джем', 'Клубника', 'Лёд')
+        )
+        Ingredient.objects.create(name='Ёрш', measurement_unit='шт')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in json.loads(response.content)]
+
+    def test_database_search(self):
+        for max_size in (100, 0):
+            with self.subTest(max_size=max_size):
+                with self.settings(INGREDIENT_INDEX_MAX_SIZE=max_size):
+                    cache.clear()
+                    self.assertEqual(
+                        self.search('еж'),
+                        ['Ёжевика', 'ежевичный джем']
+                    )
+                    self.assertEqual(self.search('ЛЕД'), ['Лёд'])
+                    self.assertEqual(self.search('ерш'), ['Ёрш'])
+
+    def test_search_name_saved(self):
+        ingredient = Ingredient.objects.get(name='Лёд')
+        ingredient.name = 'Ёлка'
+        ingredient.save(update_fields=['name'])
+        ingredient.refresh_from_db()
+        self.assertEqual(ingredient.search_name, 'елка')
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class AsyncViewsTest(TransactionTestCase):
+    """
+    Асинхронные представления читают в пуле потоков, а изменения
+    передают синхронным представлениям.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create(
+            username='user',
+            email='user@example.com'
+        )
+        self.tag = Tag.objects.create(
+            name='тег',
+            color='#E26C2D',
+            slug='tag'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='ингредиент',
+            measurement_unit='г'
+        )
+        self.factory = APIRequestFactory()
+
+    def install_recorder(self):
+        """Обертка record_current, как при включенном SQL_INSTRUMENTATION."""
+        connection_created.connect(install_recorder)
+        self.addCleanup(connection_created.disconnect, install_recorder)
+        install_recorder(connection)
+        self.addCleanup(connection.execute_wrappers.remove, record_current)
+
+    def call(self, view, request, *args, **kwargs):
+        force_authenticate(request, self.user)
+        return async_to_sync(view)(request, *args, **kwargs)
+
+    def test_read_views_only_get(self):
+        self.assertNotIn(record_current, connection.execute_wrappers)
+        self.install_recorder()
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = self.call(
+                async_views.tag_list,
+                self.factory.get('/api/tags/')
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [tag['slug'] for tag in json.loads(response.content)],
+            ['tag']
+        )
+        # Запросы потока пула учитываются в контексте вызова.
+        self.assertGreater(recorder.count, 0)
+        response = self.call(
+            async_views.tag_list,
+            self.factory.post('/api/tags/', {'name': 'новый'})
+        )
+        self.assertEqual(response.status_code, 405)
+
+    def test_recipe_write_methods(self):
+        data = {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': image_data(),
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+        }
+        response = self.call(
+            async_views.recipe_list,
+            self.factory.post('/api/recipes/', data, format='json')
+        )
+        self.assertEqual(response.status_code, 201)
+        pk = response.data['id']
+        response = self.call(
+            async_views.recipe_detail,
+            self.factory.patch(
+                f'/api/recipes/{pk}/',
+                {'name': 'Измененный рецепт'},
+                format='json'
+            ),
+            pk=str(pk)
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.call(
+            async_views.recipe_detail,
+            self.factory.get(f'/api/recipes/{pk}/'),
+            pk=str(pk)
+        )
+        self.assertEqual(
+            json.loads(response.content)['name'],
+            'Измененный рецепт'
+        )
+        response = self.call(
+            async_views.recipe_detail,
+            self.factory.delete(f'/api/recipes/{pk}/'),
+            pk=str(pk)
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(pk=pk).exists())
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    def test_instrumentation_under_asgi(self):
+        self.install_recorder()
+        # Под ASGI промежуточный слой работает в цикле событий.
+        self.assertTrue(asyncio.iscoroutinefunction(
+            QueryInstrumentationMiddleware(async_views.tag_list)
+        ))
+
+        async def get():
+            return await AsyncClient().get('/api/tags/')
+
+        with self.assertLogs('foodgram.queries') as logs:
+            response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], 'api:tag-list')
+        self.assertGreater(entry['queries'], 0)
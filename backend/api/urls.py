@@ -1,8 +1,10 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import SimpleRouter
 
-from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+from . import async_views
+from .views import (CustomUserViewSet, IngredientViewSet, QueryStatsView,
+                    RecipeViewSet, TagViewSet)
 
 app_name = 'api'
 
@@ -12,7 +14,32 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 
-urlpatterns = [
+# Под ASGI эти URL обрабатываются асинхронными представлениями
+# раньше маршрутов router, поэтому id ограничен цифрами и не
+# перехватывает дополнительные действия вроде recipes/match/.
+async_urlpatterns = [
+    path('recipes/', async_views.recipe_list, name='recipes-list'),
+    re_path(
+        r'^recipes/(?P<pk>\d+)/$',
+        async_views.recipe_detail,
+        name='recipes-detail'
+    ),
+    path('tags/', async_views.tag_list, name='tag-list'),
+    re_path(
+        r'^tags/(?P<pk>\d+)/$',
+        async_views.tag_detail,
+        name='tag-detail'
+    ),
+    path('ingredients/', async_views.ingredient_list, name='ingredient-list'),
+    re_path(
+        r'^ingredients/(?P<pk>\d+)/$',
+        async_views.ingredient_detail,
+        name='ingredient-detail'
+    ),
+]
+
+urlpatterns = (async_urlpatterns if settings.ASYNC_READ_VIEWS else []) + [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('stats/queries/', QueryStatsView.as_view(), name='query-stats'),
 ]
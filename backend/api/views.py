@@ -1,25 +1,46 @@
-import csv
+import hashlib
 from urllib.parse import unquote
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (BooleanField, Count, Max, OuterRef, Prefetch,
+                              Subquery, Value)
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from core.cache import get_versions
+from core.middleware import request_stats
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            normalize)
 from users.models import User, UserSubscription
 
-from .paginators import RecipePagination
+from .autocomplete import INGREDIENTS_VERSION_NAME, ingredient_index
+from .exporters import export_shopping_cart
+from .feed import get_feed_head_key, get_following_ids
+from .matching import RECIPES_DELETED_VERSION_NAME, recipe_ingredient_index
+from .mixins import (TAGS_VERSION_NAME, USERS_VERSION_NAME,
+                     ConditionalGetMixin, UserRelationsMixin,
+                     VersionedCacheMixin, user_state_version_name)
+from .paginators import (RECIPE_ORDERINGS, RECIPES_RANKING_VERSION_NAME,
+                         RecipeCursorPagination, RecipePagination,
+                         get_list_limit, get_recipe_ordering,
+                         get_recipe_paginator)
 from .permissions import IsAdminAuthorOrReadOnly
+from .recommendations import get_recommended_ids
+from .renderers import (CSVRenderer, FileContentNegotiation, PDFRenderer,
+                        TxtRenderer)
 from .serializers import (FavoriteRecipeSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, TagSerializer,
-                          UserSubscribeSerializer)
+                          RecipeCreateSerializer, RecipeMatchSerializer,
+                          RecipeSerializer, TagSerializer,
+                          UserSubscribeSerializer, get_recipes_limit)
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(UserRelationsMixin, UserViewSet):
     """
     Вьюсет Пользователя с дополнительными URL:
 
@@ -42,28 +63,26 @@ class CustomUserViewSet(UserViewSet):
                 'Подписываться на себя нельзя',
                 status.HTTP_400_BAD_REQUEST
             )
-        is_exists = UserSubscription.objects.filter(
-            user=user,
-            following=following
-        ).exists()
-        if request.method == 'POST' and not is_exists:
-            UserSubscription.objects.create(
+        if request.method == 'POST':
+            _, created = UserSubscription.objects.get_or_create(
                 user=user,
                 following=following
             )
-            serializer = UserSubscribeSerializer(
-                following,
-                many=False,
-                context=self.request)
-            return Response(serializer.data, status.HTTP_201_CREATED)
-        if request.method == 'DELETE' and is_exists:
-            UserSubscription.objects.filter(
+            if created:
+                serializer = UserSubscribeSerializer(
+                    following,
+                    many=False,
+                    context=self.get_serializer_context())
+                return Response(serializer.data, status.HTTP_201_CREATED)
+        else:
+            deleted, _ = UserSubscription.objects.filter(
                 user=user,
                 following=following
             ).delete()
-            return Response(
-                'Пользователь успешно удален из подписок',
-                status.HTTP_204_NO_CONTENT)
+            if deleted:
+                return Response(
+                    'Пользователь успешно удален из подписок',
+                    status.HTTP_204_NO_CONTENT)
         return Response('Действие невозможно', status.HTTP_400_BAD_REQUEST)
 
     @action(
@@ -73,17 +92,33 @@ class CustomUserViewSet(UserViewSet):
         url_path='subscriptions',
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(follower__user=request.user)
+        recipes = Recipe.objects.all()
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        queryset = User.objects.filter(
+            follower__user=request.user
+        ).annotate(
+            subscribed=Value(True, BooleanField())
+        ).prefetch_related(
+            Prefetch('recipe_set', queryset=recipes, to_attr='latest_recipes')
+        )
         page = self.paginate_queryset(queryset)
         serializer = UserSubscribeSerializer(
             page,
             many=True,
-            context=self.request
+            context=self.get_serializer_context()
         )
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(mixins.ListModelMixin,
+class RecipeViewSet(UserRelationsMixin,
+                    ConditionalGetMixin,
+                    mixins.ListModelMixin,
                     mixins.RetrieveModelMixin,
                     mixins.CreateModelMixin,
                     mixins.UpdateModelMixin,
@@ -96,11 +131,23 @@ class RecipeViewSet(mixins.ListModelMixin,
     favorite -- Добавить/удалить рецепт из избранного.
     shopping_cart -- Добавить/удалить рецепт из списка покупок
     download_shopping_cart -- Скачать файл списка покупок.
+    match -- Подобрать рецепты по имеющимся ингредиентам.
+    recommended -- Рекомендованные пользователю рецепты.
+    feed -- Новые рецепты авторов из подписок пользователя.
     """
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     permission_classes = (IsAdminAuthorOrReadOnly,)
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.action == 'feed':
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = get_recipe_paginator(self.request)
+        return self._paginator
+
     def get_queryset(self):
         is_favorited = self.request.query_params.get('is_favorited')
         is_in_shopping_cart = self.request.query_params.get(
@@ -108,23 +155,84 @@ class RecipeViewSet(mixins.ListModelMixin,
         )
         tags = self.request.query_params.getlist('tags')
         author = self.request.query_params.get('author')
+        search = self.request.query_params.get('search', '').strip()
+        queryset = self.queryset.with_user_flags(self.request.user)
+        if search:
+            queryset = queryset.search(search)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.with_related(self.request.user)
         if is_favorited == '1':
-            self.queryset = self.queryset.filter(
-                favorite__user=self.request.user
-            )
+            queryset = queryset.filter(favorited=True)
         if is_in_shopping_cart == '1':
-            self.queryset = self.queryset.filter(
-                is_in_shopping_cart__user=self.request.user
-            )
+            queryset = queryset.filter(in_shopping_cart=True)
 
         if author:
-            self.queryset = self.queryset.filter(
+            queryset = queryset.filter(
                 author=author
             )
         if tags:
-            self.queryset = self.queryset.filter(
+            queryset = queryset.filter(
                 tags__slug__in=tags).distinct()
-        return self.queryset
+        return queryset.order_by(*get_recipe_ordering(self.request))
+
+    def get_validator_versions(self, request, *names):
+        """
+        Пользователь запроса и версии данных, которые входят в ответ,
+        кроме самих рецептов: состояние пользователя, теги, ингредиенты
+        и авторы, а также names.
+        """
+        names = [
+            TAGS_VERSION_NAME,
+            INGREDIENTS_VERSION_NAME,
+            USERS_VERSION_NAME,
+            *names
+        ]
+        user = None
+        if request.user.is_authenticated:
+            user = request.user.pk
+            names.append(user_state_version_name(user))
+        versions = get_versions(names)
+        return user, [versions[name] for name in names]
+
+    def make_validators(self, key, updated, versions):
+        etag = hashlib.md5(
+            f'{key}:{":".join(map(str, versions))}:'
+            f'{updated.timestamp()}'.encode()
+        ).hexdigest()
+        last_modified = max(updated.timestamp(), max(versions) / 1e9)
+        return f'"{etag}"', int(last_modified)
+
+    def get_list_validators(self, request):
+        if isinstance(self.paginator, RecipeCursorPagination):
+            return None, None
+        names = [RECIPES_DELETED_VERSION_NAME]
+        if get_recipe_ordering(request) in RECIPE_ORDERINGS.values():
+            names.append(RECIPES_RANKING_VERSION_NAME)
+        user, versions = self.get_validator_versions(request, *names)
+        recipes = self.filter_queryset(self.get_queryset()).aggregate(
+            count=Count('pk'),
+            updated=Max('updated')
+        )
+        if recipes['updated'] is None:
+            return None, None
+        return self.make_validators(
+            f'{request.get_full_path()}:{user}:{recipes["count"]}',
+            recipes['updated'],
+            versions
+        )
+
+    def get_object_validators(self, request, *args, **kwargs):
+        user, versions = self.get_validator_versions(request)
+        updated = Recipe.objects.filter(
+            pk=kwargs.get(self.lookup_field)
+        ).values_list('updated', flat=True).first()
+        if updated is None:
+            return None, None
+        return self.make_validators(
+            f'{kwargs[self.lookup_field]}:{user}',
+            updated,
+            versions
+        )
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -133,36 +241,40 @@ class RecipeViewSet(mixins.ListModelMixin,
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(
-        methods=['POST', 'DELETE'],
-        permission_classes=(IsAuthenticated,),
-        detail=True,
-        url_path='favorite',
-    )
-    def favorite(self, request, pk):
+    def add_or_remove(self, request, pk, model, removed_message):
+        """Добавляет рецепт в список model пользователя или удаляет из него."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        is_exists = Favorite.objects.filter(
-            recipe=recipe,
-            user=request.user
-        ).exists()
-        if request.method == 'POST' and not is_exists:
-            Favorite.objects.create(
+        if request.method == 'POST':
+            _, created = model.objects.get_or_create(
                 recipe=recipe,
                 user=request.user
             )
-            serializer = FavoriteRecipeSerializer(recipe, many=False)
-            return Response(serializer.data, status.HTTP_201_CREATED)
-        if request.method == 'DELETE' and is_exists:
-            Favorite.objects.filter(
+            if created:
+                serializer = FavoriteRecipeSerializer(recipe, many=False)
+                return Response(serializer.data, status.HTTP_201_CREATED)
+        else:
+            deleted, _ = model.objects.filter(
                 recipe=recipe,
                 user=request.user
             ).delete()
-            return Response(
-                'Рецепт успешно удален из избранного',
-                status.HTTP_204_NO_CONTENT
-            )
+            if deleted:
+                return Response(removed_message, status.HTTP_204_NO_CONTENT)
         return Response('Действие невозможно', status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        detail=True,
+        url_path='favorite',
+    )
+    def favorite(self, request, pk):
+        return self.add_or_remove(
+            request,
+            pk,
+            Favorite,
+            'Рецепт успешно удален из избранного'
+        )
+
     @action(
         methods=['POST', 'DELETE'],
         permission_classes=(IsAuthenticated,),
@@ -170,87 +282,181 @@ class RecipeViewSet(mixins.ListModelMixin,
         url_path='shopping_cart',
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        is_exists = ShoppingCart.objects.filter(
-            recipe=recipe,
-            user=request.user
-        ).exists()
-        if request.method == 'POST' and not is_exists:
-            ShoppingCart.objects.create(
-                recipe=recipe,
-                user=request.user
-            )
-            serializer = FavoriteRecipeSerializer(recipe, many=False)
-            return Response(serializer.data, status.HTTP_201_CREATED)
-        if request.method == 'DELETE' and is_exists:
-            ShoppingCart.objects.filter(
-                recipe=recipe,
-                user=request.user
-            ).delete()
-            return Response(
-                'Рецепт успешно удален из избранного',
-                status.HTTP_204_NO_CONTENT
-            )
-        return Response('Действие невозможно', status.HTTP_400_BAD_REQUEST)
+        return self.add_or_remove(
+            request,
+            pk,
+            ShoppingCart,
+            'Рецепт успешно удален из списка покупок'
+        )
 
     @action(
         methods=['GET'],
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(TxtRenderer, CSVRenderer, PDFRenderer),
+        content_negotiation_class=FileContentNegotiation,
         detail=False,
         url_path='download_shopping_cart',
     )
     def download_shopping_cart(self, request):
-        shopping_carts = ShoppingCart.objects.filter(user=request.user)
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="cart.txt"'
-        response['Content-Type'] = 'charset=utf-8'
-        writer = csv.writer(response)
-        file_data = {}
-        for recipe in shopping_carts:
-            ingredients = recipe.recipe.ingredients.values(
-                "name",
-                "measurement_unit",
-                "ingredientrecipe__amount")
-            for ingredient in ingredients:
-                name = ingredient['name']
-                amount = ingredient['ingredientrecipe__amount']
-                measurement_unit = ingredient['measurement_unit']
-                if name in file_data:
-                    file_data[name]['amount'] += amount
-                else:
-                    file_data[name] = {
-                        'name': name,
-                        'amount': amount,
-                        'measurement_unit': measurement_unit
-                    }
-        for ingredient in file_data.values():
-            writer.writerow([f'· '
-                             f'{ingredient["name"]} '
-                             f'({ingredient["measurement_unit"]}) - '
-                             f'{ingredient["amount"]}'])
+        file_format = request.accepted_renderer.format
+        content = export_shopping_cart(request.user, file_format)
+        return Response(
+            content,
+            headers={
+                'Content-Disposition':
+                    f'attachment; filename="cart.{file_format}"'
+            }
+        )
+
+    @action(
+        methods=['GET'],
+        permission_classes=(AllowAny,),
+        detail=False,
+        url_path='match',
+    )
+    def match(self, request):
+        ingredients = request.query_params.getlist('ingredients')
+        if not all(ingredient.isdigit() for ingredient in ingredients):
+            return Response(
+                {'ingredients': 'Ожидаются id ингредиентов.'},
+                status.HTTP_400_BAD_REQUEST
+            )
+        limit = get_list_limit(
+            request,
+            settings.REST_FRAMEWORK['PAGE_SIZE']
+        )
+        matches = recipe_ingredient_index.match(map(int, ingredients), limit)
+        recipes = Recipe.objects.with_user_flags(
+            request.user
+        ).with_related(request.user).in_bulk(
+            [recipe for recipe, _, _ in matches]
+        )
+        result = []
+        for recipe, matched, missing in matches:
+            if recipe not in recipes:
+                continue
+            recipes[recipe].matched_ingredients = matched
+            recipes[recipe].missing_ingredients = missing
+            result.append(recipes[recipe])
+        serializer = RecipeMatchSerializer(
+            result,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        detail=False,
+        url_path='recommended',
+    )
+    def recommended(self, request):
+        recipe_ids = get_recommended_ids(
+            request.user,
+            get_list_limit(request, settings.REST_FRAMEWORK['PAGE_SIZE'])
+        )
+        recipes = Recipe.objects.with_user_flags(
+            request.user
+        ).with_related(request.user).in_bulk(recipe_ids)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        detail=False,
+        url_path='feed',
+    )
+    def feed(self, request):
+        following = get_following_ids(request.user)
+        key = None
+        if 'cursor' not in request.query_params:
+            key = get_feed_head_key(
+                request.user,
+                following,
+                request.get_full_path()
+            )
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+        queryset = Recipe.objects.filter(
+            author__in=following
+        ).with_user_flags(request.user).with_related(request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeSerializer(
+            page,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        response = self.get_paginated_response(serializer.data)
+        if key is not None:
+            cache.set(key, response.data, settings.FEED_CACHE_TIMEOUT)
         return response
 
 
-class TagViewSet(mixins.ListModelMixin,
+class TagViewSet(VersionedCacheMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny, ]
+    cache_version_name = TAGS_VERSION_NAME
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(VersionedCacheMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [AllowAny, ]
+    cache_version_name = INGREDIENTS_VERSION_NAME
 
     def get_queryset(self):
         name = self.request.query_params.get('name')
         if name is not None:
             name = unquote(name, 'cp1251')
-            self.queryset = self.queryset.filter(name__startswith=name)
+            self.queryset = self.queryset.filter(
+                search_name__startswith=normalize(name)
+            ).order_by('search_name')
         return self.queryset
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.search, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        """
+        Ингредиенты, название которых начинается с параметра name:
+        из индекса в памяти или, для большого справочника, из базы.
+        """
+        limit = request.query_params.get('limit', '')
+        limit = int(limit) if limit.isdigit() else None
+        if not ingredient_index.refresh(settings.INGREDIENT_INDEX_MAX_SIZE):
+            queryset = self.get_queryset()[:limit]
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+        name = unquote(request.query_params.get('name', ''), 'cp1251')
+        return Response(ingredient_index.search(name, limit))
+
+
+class QueryStatsView(APIView):
+    """
+    Статистика запросов к базе данных по представлениям.
+    Доступна только персоналу, DELETE сбрасывает накопленные значения.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(request_stats.snapshot())
+
+    def delete(self, request):
+        request_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+
+        if settings.SQL_INSTRUMENTATION:
+            from .middleware import install_recorder
+            connection_created.connect(install_recorder)
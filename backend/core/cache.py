@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    """
+    Возвращает текущую версию набора данных name.
+
+    Версия используется как часть ключа кэша: после bump_version
+    все ранее закэшированные значения перестают находиться.
+    Версия -- время последнего изменения в наносекундах, поэтому
+    ее можно использовать и как дату изменения.
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        return cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Увеличивает версию набора данных name."""
+    key = _version_key(name)
+    version = cache.get(key) or 0
+    cache.set(key, max(time.time_ns(), version + 1), None)
+
+
+def get_versions(names):
+    """Версии нескольких наборов данных одним обращением к кэшу."""
+    cached = cache.get_many([_version_key(name) for name in names])
+    return {
+        name: cached.get(_version_key(name)) or get_version(name)
+        for name in names
+    }
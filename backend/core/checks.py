@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Бэкенды кэша, у каждого процесса которых свои данные.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии наборов данных хранятся в кэше, и при кэше в памяти
+    процесса изменение в одном воркере не видно остальным.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f'Кэш {backend} не общий для процессов, версии кэша '
+        f'не будут сбрасываться в других воркерах.',
+        hint='Укажите CACHE_BACKEND и CACHE_LOCATION, например memcached.',
+        id='core.E001',
+    )]
@@ -0,0 +1,328 @@
+import io
+import multiprocessing
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections
+from PIL import Image
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagRecipe)
+from users.models import User, UserSubscription
+
+BATCH_SIZE = 1000
+
+# Количество рецептов или пользователей в одной задаче генерации.
+CHUNK_SIZE = 10000
+
+PLACEHOLDER_IMAGE = 'recipe/images/placeholder_{}.jpg'
+PLACEHOLDER_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2F80ED',
+                      '#EB5757', '#6FCF97', '#BB6BD9', '#F2994A', '#56CCF2')
+
+DISH_NAMES = ('Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Паста',
+              'Омлет', 'Каша', 'Котлеты', 'Смузи', 'Плов', 'Блины')
+
+# Показатель степени распределения Ципфа популярности рецептов,
+# авторов и ингредиентов.
+POPULARITY_EXPONENT = 1.0
+
+# Параметр распределения Парето активности пользователей.
+ACTIVITY_ALPHA = 1.5
+
+_generator = None
+
+
+def insert(model, objects, ignore_conflicts=False):
+    """bulk_create пачками не больше BATCH_SIZE и лимита базы данных."""
+    objects = list(objects)
+    batch_size = min(BATCH_SIZE, connection.ops.bulk_batch_size(
+        model._meta.concrete_fields,
+        objects
+    ) or BATCH_SIZE)
+    return model.objects.bulk_create(
+        objects,
+        batch_size=batch_size,
+        ignore_conflicts=ignore_conflicts
+    )
+
+
+def bulk_create(model, objects):
+    """
+    insert, после которого у объектов заполнены pk.
+
+    Если база данных не возвращает id вставленных записей (SQLite),
+    они читаются отдельным запросом, поэтому одновременно в таблицу
+    никто больше писать не должен.
+    """
+    objects = insert(model, objects)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by('-pk').values_list(
+            'pk',
+            flat=True
+        )[:len(objects)]
+        for obj, pk in zip(objects, reversed(list(pks))):
+            obj.pk = pk
+    return objects
+
+
+def popularity(items, rng):
+    """
+    Перемешанные items и накопленные веса распределения Ципфа:
+    первые элементы выбираются намного чаще остальных.
+    """
+    items = list(items)
+    rng.shuffle(items)
+    weights = accumulate(
+        1 / rank ** POPULARITY_EXPONENT for rank in range(1, len(items) + 1)
+    )
+    return items, list(weights)
+
+
+def activity(rng, mean, limit):
+    """Количество действий пользователя с тяжелым хвостом и средним mean."""
+    scale = mean * (ACTIVITY_ALPHA - 1) / ACTIVITY_ALPHA
+    return min(int(scale * rng.paretovariate(ACTIVITY_ALPHA)), limit)
+
+
+def create_users(count, password, prefix='user'):
+    """count пользователей с одинаковым паролем."""
+    start = User.objects.filter(username__startswith=prefix).count()
+    password = make_password(password)
+    users = []
+    for offset in range(0, count, CHUNK_SIZE):
+        users += bulk_create(User, [
+            User(
+                username=f'{prefix}{start + index}',
+                email=f'{prefix}{start + index}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password
+            )
+            for index in range(offset, min(offset + CHUNK_SIZE, count))
+        ])
+    return users
+
+
+def create_catalog(ingredients, tags):
+    """Справочники ингредиентов и тегов для пустой базы данных."""
+    return (
+        bulk_create(Ingredient, [
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(ingredients)
+        ]),
+        bulk_create(Tag, [
+            Tag(
+                name=f'тег {index}',
+                color=PLACEHOLDER_COLORS[index % len(PLACEHOLDER_COLORS)],
+                slug=f'tag{index}'
+            )
+            for index in range(tags)
+        ])
+    )
+
+
+def create_placeholder_images():
+    """Одноцветные изображения рецептов в хранилище медиафайлов."""
+    names = []
+    for index, color in enumerate(PLACEHOLDER_COLORS):
+        name = PLACEHOLDER_IMAGE.format(index)
+        if not default_storage.exists(name):
+            buffer = io.BytesIO()
+            Image.new('RGB', (600, 400), color).save(buffer, 'jpeg')
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        names.append(name)
+    return names
+
+
+class FakeDataGenerator:
+    """
+    Генератор рецептов и связей пользователей по частям.
+
+    Каждая часть создается независимо со своим seed, поэтому части
+    можно создавать в нескольких процессах одновременно.
+    """
+
+    def __init__(self, author_ids, ingredients, tag_ids, images, seed=None,
+                 ingredients_range=(5, 30), tags_range=(1, 3)):
+        rng = random.Random(seed)
+        self.authors, self.author_weights = popularity(author_ids, rng)
+        self.ingredients, self.ingredient_weights = popularity(
+            ingredients,
+            rng
+        )
+        self.tag_ids = list(tag_ids)
+        self.images = images
+        self.ingredients_range = ingredients_range
+        self.tags_range = tags_range
+        self.recipes = None
+        self.recipe_weights = None
+
+    def choose_ingredients(self, rng):
+        low, high = self.ingredients_range
+        size = min(int(rng.triangular(low, high, low + (high - low) / 4)),
+                   len(self.ingredients))
+        chosen = dict.fromkeys(rng.choices(
+            self.ingredients,
+            cum_weights=self.ingredient_weights,
+            k=size * 3
+        ))
+        if len(chosen) < size:
+            chosen.update(dict.fromkeys(rng.sample(self.ingredients, size)))
+        return list(chosen)[:size]
+
+    def create_recipes(self, count, seed):
+        """count рецептов со случайными ингредиентами и тегами."""
+        rng = random.Random(seed)
+        recipes = []
+        compositions = []
+        for _ in range(count):
+            ingredients = self.choose_ingredients(rng)
+            names = [name for _, name in ingredients]
+            recipes.append(Recipe(
+                name=f'{rng.choice(DISH_NAMES)} ({names[0]})',
+                text=f'Приготовить из: {", ".join(names)}.',
+                cooking_time=rng.randint(5, 180),
+                image=rng.choice(self.images),
+                author_id=rng.choices(
+                    self.authors,
+                    cum_weights=self.author_weights
+                )[0]
+            ))
+            compositions.append(ingredients)
+        recipes = bulk_create(Recipe, recipes)
+        insert(IngredientRecipe, (
+            IngredientRecipe(
+                recipe_id=recipe.pk,
+                ingredient_id=pk,
+                amount=rng.randint(1, 500)
+            )
+            for recipe, ingredients in zip(recipes, compositions)
+            for pk, _ in ingredients
+        ))
+        insert(TagRecipe, (
+            TagRecipe(recipe_id=recipe.pk, tag_id=pk)
+            for recipe in recipes
+            for pk in rng.sample(
+                self.tag_ids,
+                min(rng.randint(*self.tags_range), len(self.tag_ids))
+            )
+        ))
+        return count
+
+    def run(self, method, tasks, workers=1, progress=None):
+        """
+        Вызывает метод method для каждого набора аргументов из tasks
+        в workers процессах, progress получает результат каждого вызова.
+
+        Перед запуском процессов соединения с базой данных закрываются,
+        и каждый процесс открывает свое.
+        """
+        tasks = [(method, args) for args in tasks]
+        if workers <= 1:
+            _set_generator(self)
+            results = map(_run_task, tasks)
+        else:
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(
+                workers,
+                _set_generator,
+                (self,)
+            )
+            results = pool.imap_unordered(_run_task, tasks)
+        try:
+            for result in results:
+                if progress is not None:
+                    progress(result)
+        finally:
+            if workers > 1:
+                pool.close()
+                pool.join()
+
+    def load_recipes(self, recipe_ids, seed=None):
+        self.recipes, self.recipe_weights = popularity(
+            recipe_ids,
+            random.Random(seed)
+        )
+
+    def create_relations(self, user_ids, seed, favorites, carts,
+                         subscriptions):
+        """
+        Избранное, списки покупок и подписки пользователей user_ids.
+
+        Количество записей у пользователей распределено по Парето
+        со средними favorites, carts и subscriptions, популярные
+        рецепты и авторы выбираются чаще.
+        """
+        rng = random.Random(seed)
+        for model, mean, targets, weights, field in (
+                (Favorite, favorites, self.recipes, self.recipe_weights,
+                 'recipe_id'),
+                (ShoppingCart, carts, self.recipes, self.recipe_weights,
+                 'recipe_id'),
+                (UserSubscription, subscriptions, self.authors,
+                 self.author_weights, 'following_id')):
+            # Подписаться на себя нельзя, а id рецептов с id
+            # пользователей не сравниваются.
+            is_subscription = model is UserSubscription
+            insert(model, (
+                model(user_id=user, **{field: target})
+                for user in user_ids
+                for target in set(rng.choices(
+                    targets,
+                    cum_weights=weights,
+                    k=activity(rng, mean, len(targets))
+                ))
+                if not (is_subscription and target == user)
+            ), ignore_conflicts=True)
+        return len(user_ids)
+
+
+def _set_generator(generator):
+    global _generator
+    _generator = generator
+
+
+def _run_task(task):
+    method, args = task
+    return getattr(_generator, method)(*args)
+
+
+def recipe_tasks(count, seed):
+    return [
+        (min(CHUNK_SIZE, count - offset), f'{seed}:recipes:{offset}')
+        for offset in range(0, count, CHUNK_SIZE)
+    ]
+
+
+def relation_tasks(user_ids, seed, favorites, carts, subscriptions):
+    return [
+        (user_ids[offset:offset + CHUNK_SIZE], f'{seed}:relations:{offset}',
+         favorites, carts, subscriptions)
+        for offset in range(0, len(user_ids), CHUNK_SIZE)
+    ]
+
+
+def create_dataset(users, recipes, ingredients=500, tags=5, seed=None):
+    """Синтетический набор данных в пустой базе данных."""
+    created_users = create_users(users, password='password')
+    catalog_ingredients, catalog_tags = create_catalog(ingredients, tags)
+    user_ids = [user.pk for user in created_users]
+    generator = FakeDataGenerator(
+        user_ids,
+        [(item.pk, item.name) for item in catalog_ingredients],
+        [tag.pk for tag in catalog_tags],
+        create_placeholder_images(),
+        seed=seed
+    )
+    generator.run('create_recipes', recipe_tasks(recipes, seed))
+    generator.load_recipes(
+        list(Recipe.objects.values_list('pk', flat=True)),
+        seed
+    )
+    generator.run(
+        'create_relations',
+        relation_tasks(user_ids, seed, 10, 3, 5)
+    )
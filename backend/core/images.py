@@ -0,0 +1,197 @@
+import base64
+import binascii
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+logger = logging.getLogger('foodgram.images')
+
+# Размер порции base64 при декодировании, кратен 4.
+DECODE_CHUNK_SIZE = 64 * 1024
+
+ALLOWED_IMAGE_TYPES = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+
+# Уменьшенные копии изображения: имя -> наибольшая сторона в пикселях.
+IMAGE_VARIANTS = {
+    'list': 480,
+    'detail': 1200,
+}
+
+
+class ImageDecodeError(ValueError):
+    pass
+
+
+def decode_base64_image(data):
+    """
+    Декодирует изображение из data URI по частям во временный файл.
+
+    Размер результата ограничен settings.MAX_IMAGE_UPLOAD_SIZE,
+    поэтому большой запрос не разворачивается в память целиком.
+    """
+    try:
+        header, encoded = data.split(';base64,', 1)
+    except ValueError:
+        raise ImageDecodeError('Некорректный формат изображения.')
+    ext = header.split('/')[-1].lower()
+    if ext not in ALLOWED_IMAGE_TYPES:
+        raise ImageDecodeError(f'Неподдерживаемый тип изображения: {ext}.')
+    if len(encoded) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+        raise ImageDecodeError('Изображение слишком большое.')
+    result = tempfile.SpooledTemporaryFile(max_size=DECODE_CHUNK_SIZE * 16)
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+            result.write(base64.b64decode(
+                encoded[start:start + DECODE_CHUNK_SIZE],
+                validate=True
+            ))
+    except binascii.Error:
+        result.close()
+        raise ImageDecodeError('Некорректная строка base64.')
+    result.seek(0)
+    return File(result, name=f'temp.{ext}')
+
+
+def variant_name(name, variant, image_format='jpeg'):
+    """Путь к уменьшенной копии изображения name."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    ext = 'webp' if image_format == 'webp' else 'jpg'
+    return os.path.join(directory, 'variants', f'{stem}_{variant}.{ext}')
+
+
+def variant_names(name):
+    """Пути всех уменьшенных копий изображения name."""
+    return [
+        variant_name(name, variant, image_format)
+        for variant in IMAGE_VARIANTS
+        for image_format in ('jpeg', 'webp')
+    ]
+
+
+def _resize(image, size):
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def create_variants(field_file):
+    """
+    Сохраняет уменьшенные копии изображения в JPEG и WebP
+    рядом с оригиналом в хранилище field_file.
+    """
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = _resize(image, size)
+        for image_format in ('jpeg', 'webp'):
+            buffer = io.BytesIO()
+            resized.save(
+                buffer,
+                image_format,
+                quality=settings.IMAGE_VARIANT_QUALITY
+            )
+            name = variant_name(field_file.name, variant, image_format)
+            field_file.storage.delete(name)
+            field_file.storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id):
+    """Создает уменьшенные копии изображения рецепта recipe_id."""
+    from recipes.models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    create_variants(recipe.image)
+    Recipe.objects.filter(
+        pk=recipe_id,
+        image=recipe.image.name
+    ).update(image_processed=True, updated=timezone.now())
+
+
+def process_in_worker(recipe_id):
+    close_old_connections()
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        close_old_connections()
+
+
+def release_image(name):
+    """
+    Удаляет уменьшенные копии изображения name, если ни один рецепт
+    его больше не использует (одно изображение может быть у многих
+    рецептов, например у созданных generate_fake_data).
+    """
+    from recipes.models import Recipe
+
+    if Recipe.objects.filter(image=name).exists():
+        return
+    storage = Recipe._meta.get_field('image').storage
+    for variant in variant_names(name):
+        storage.delete(variant)
+
+
+def release_in_worker(name):
+    close_old_connections()
+    try:
+        release_image(name)
+    finally:
+        close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PROCESSING_WORKERS,
+        thread_name_prefix='images'
+    )
+
+
+def log_failure(task, future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Ошибка %s', task, exc_info=error)
+
+
+def submit(func, *args):
+    """Выполняет func в пуле потоков, ошибки пишутся в лог."""
+    future = get_executor().submit(func, *args)
+    future.add_done_callback(partial(log_failure, f'{func.__name__}{args}'))
+
+
+def schedule_recipe_image(recipe_id):
+    """
+    Запускает обработку изображения после коммита транзакции.
+
+    При IMAGE_PROCESSING_WORKERS = 0 обработка выполняется сразу
+    в текущем потоке.
+    """
+    if not settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+        return
+    transaction.on_commit(lambda: submit(process_in_worker, recipe_id))
+
+
+def schedule_release_image(name):
+    """Удаляет копии изображения name после коммита транзакции."""
+    if not settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(lambda: release_image(name))
+        return
+    transaction.on_commit(lambda: submit(release_in_worker, name))
@@ -0,0 +1,368 @@
+import base64
+import io
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from itertools import count
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from core.fake_data import create_dataset
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User, UserSubscription
+
+# Наибольшее допустимое количество запросов к базе данных.
+QUERY_BUDGETS = {
+    'users list': 3,
+    'users me': 1,
+    'users detail': 2,
+    'users subscriptions': 3,
+    'users subscribe': 7,
+    'users unsubscribe': 5,
+    'recipes list': 6,
+    'recipes list cursor': 4,
+    'recipes list popular': 6,
+    'recipes list search': 6,
+    'recipes list filtered': 6,
+    'recipes detail': 5,
+    # В PostgreSQL добавляется обновление search_vector.
+    'recipes create': 16,
+    'recipes update': 20,
+    'recipes delete': 11,
+    'recipes favorite': 5,
+    'recipes unfavorite': 5,
+    'recipes shopping cart': 5,
+    'recipes shopping cart remove': 5,
+    'recipes download txt': 1,
+    'recipes download csv': 1,
+    'recipes match': 6,
+    'recipes recommended': 5,
+    'recipes feed': 5,
+    'tags list': 1,
+    'tags detail': 1,
+    'ingredients list': 2,
+    'ingredients detail': 1,
+    'auth login': 6,
+    'query stats': 0,
+}
+
+
+def image_data():
+    """Небольшое изображение PNG в виде data URI."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 100, 50)).save(buffer, 'png')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Benchmark:
+    """Сценарии запросов к API для набора данных в базе."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user = User.objects.order_by('-followers_count', 'pk').first()
+        self.user.is_staff = True
+        self.user.save(update_fields=('is_staff',))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.anonymous = APIClient()
+        self.recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        self.tags = list(Tag.objects.values_list('pk', 'slug'))
+        # Названия существующих рецептов: поиск находит их, а не
+        # возвращает пустой список.
+        self.search_terms = list(Recipe.objects.filter(
+            pk__in=rng.sample(self.recipe_ids, min(len(self.recipe_ids), 20))
+        ).values_list('name', flat=True))
+        self.others = list(User.objects.exclude(
+            pk=self.user.pk
+        ).exclude(
+            follower__user=self.user
+        ).values_list('pk', flat=True))
+        self.favorites = list(Recipe.objects.exclude(
+            favorite__user=self.user
+        ).values_list('pk', flat=True))
+        self.carts = list(Recipe.objects.exclude(
+            is_in_shopping_cart__user=self.user
+        ).values_list('pk', flat=True))
+        self.created = []
+        self.image = image_data()
+
+    def recipe_data(self):
+        return {
+            'name': 'Рецепт для замера',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [pk for pk, _ in self.rng.sample(self.tags, 2)],
+            'ingredients': [
+                {'id': pk, 'amount': self.rng.randint(1, 100)}
+                for pk in self.rng.sample(self.ingredient_ids, 10)
+            ],
+        }
+
+    def scenarios(self):
+        """Имя сценария и функция, выполняющая один запрос."""
+        client = self.client
+        rng = self.rng
+        subscribed, unsubscribed = count(), count()
+        favorited, unfavorited = count(), count()
+        added, removed = count(), count()
+        return (
+            ('users list', lambda: client.get('/api/users/?limit=10')),
+            ('users me', lambda: client.get('/api/users/me/')),
+            ('users detail', lambda: client.get(
+                f'/api/users/{rng.choice(self.others)}/'
+            )),
+            ('users subscriptions', lambda: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            )),
+            ('users subscribe', lambda: client.post(
+                f'/api/users/{self.others[next(subscribed)]}/subscribe/'
+            )),
+            ('users unsubscribe', lambda: client.delete(
+                f'/api/users/{self.others[next(unsubscribed)]}/subscribe/'
+            )),
+            ('recipes list', lambda: client.get('/api/recipes/')),
+            ('recipes list cursor', lambda: client.get(
+                '/api/recipes/?pagination=cursor'
+            )),
+            ('recipes list popular', lambda: client.get(
+                '/api/recipes/?ordering=popular'
+            )),
+            ('recipes list search', lambda: client.get(
+                '/api/recipes/',
+                {'search': rng.choice(self.search_terms)}
+            )),
+            ('recipes list filtered', lambda: client.get(
+                f'/api/recipes/?tags={rng.choice(self.tags)[1]}'
+                f'&is_favorited=1'
+            )),
+            ('recipes detail', lambda: client.get(
+                f'/api/recipes/{rng.choice(self.recipe_ids)}/'
+            )),
+            ('recipes create', self.create_recipe),
+            ('recipes update', lambda: client.patch(
+                f'/api/recipes/{rng.choice(self.created)}/',
+                self.recipe_data(),
+                format='json'
+            )),
+            ('recipes delete', lambda: client.delete(
+                f'/api/recipes/{self.created.pop()}/'
+            )),
+            ('recipes favorite', lambda: client.post(
+                f'/api/recipes/{self.favorites[next(favorited)]}/favorite/'
+            )),
+            ('recipes unfavorite', lambda: client.delete(
+                f'/api/recipes/{self.favorites[next(unfavorited)]}/favorite/'
+            )),
+            ('recipes shopping cart', lambda: client.post(
+                f'/api/recipes/{self.carts[next(added)]}/shopping_cart/'
+            )),
+            ('recipes shopping cart remove', lambda: client.delete(
+                f'/api/recipes/{self.carts[next(removed)]}/shopping_cart/'
+            )),
+            ('recipes download txt', lambda: client.get(
+                '/api/recipes/download_shopping_cart/?format=txt'
+            )),
+            ('recipes download csv', lambda: client.get(
+                '/api/recipes/download_shopping_cart/?format=csv'
+            )),
+            ('recipes match', lambda: client.get(
+                '/api/recipes/match/?' + '&'.join(
+                    f'ingredients={pk}'
+                    for pk in rng.sample(self.ingredient_ids, 8)
+                )
+            )),
+            ('recipes recommended', lambda: client.get(
+                '/api/recipes/recommended/'
+            )),
+            ('recipes feed', lambda: client.get('/api/recipes/feed/')),
+            ('tags list', lambda: self.anonymous.get('/api/tags/')),
+            ('tags detail', lambda: self.anonymous.get(
+                f'/api/tags/{rng.choice(self.tags)[0]}/'
+            )),
+            ('ingredients list', lambda: self.anonymous.get(
+                '/api/ingredients/?name=ингр'
+            )),
+            ('ingredients detail', lambda: self.anonymous.get(
+                f'/api/ingredients/{rng.choice(self.ingredient_ids)}/'
+            )),
+            ('auth login', lambda: self.anonymous.post(
+                '/api/auth/token/login/',
+                {'email': self.user.email, 'password': 'password'}
+            )),
+            ('query stats', lambda: client.get('/api/stats/queries/')),
+        )
+
+    def create_recipe(self):
+        response = self.client.post(
+            '/api/recipes/',
+            self.recipe_data(),
+            format='json'
+        )
+        if response.status_code == 201:
+            self.created.append(response.data['id'])
+        return response
+
+
+class Command(BaseCommand):
+    help = ('Замеряет количество запросов, время и память для каждого '
+            'URL API на синтетическом наборе данных во временной базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнять каждый сценарий'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--max-p95',
+            type=float,
+            help='Наибольшее допустимое время p95 в миллисекундах'
+        )
+        parser.add_argument(
+            '--max-memory',
+            type=float,
+            help='Наибольший допустимый пик памяти запроса в КиБ'
+        )
+        parser.add_argument(
+            '--output',
+            help='Сохранить результаты в JSON файл'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять временную базу данных'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0,
+            autoclobber=True,
+            keepdb=options['keepdb']
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root,
+                                       IMAGE_PROCESSING_WORKERS=0):
+                    results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name,
+                verbosity=0,
+                keepdb=options['keepdb']
+            )
+        self.report(results, options)
+
+    def prepare(self, options):
+        start = time.monotonic()
+        create_dataset(
+            options['users'],
+            options['recipes'],
+            ingredients=options['ingredients'],
+            seed=options['seed']
+        )
+        for command in ('update_counters', 'update_search',
+                        'update_trending', 'update_recommendations'):
+            call_command(command, stdout=io.StringIO())
+        self.stdout.write(
+            f'Набор данных: {User.objects.count()} пользователей, '
+            f'{Recipe.objects.count()} рецептов, '
+            f'{Favorite.objects.count()} в избранном, '
+            f'{ShoppingCart.objects.count()} в списках покупок, '
+            f'{UserSubscription.objects.count()} подписок '
+            f'за {time.monotonic() - start:.1f} с'
+        )
+
+    def run(self, options):
+        if settings.ASYNC_READ_VIEWS:
+            raise CommandError(
+                'Асинхронные представления обращаются к базе данных '
+                'в других потоках, запросы не будут посчитаны. '
+                'Запустите без ASYNC_READ_VIEWS'
+            )
+        self.prepare(options)
+        benchmark = Benchmark(random.Random(options['seed']))
+        results = {}
+        for name, request in benchmark.scenarios():
+            results[name] = self.measure(request, options['repeat'])
+        return results
+
+    def measure(self, request, repeat):
+        timings = []
+        queries = 0
+        statuses = set()
+        for index in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(context.captured_queries))
+            statuses.add(response.status_code)
+        tracemalloc.start()
+        request()
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        return {
+            'queries': queries,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'peak_kib': round(peak, 1),
+            'statuses': sorted(statuses),
+        }
+
+    def report(self, results, options):
+        errors = []
+        self.stdout.write(
+            f'{"сценарий":<30}{"запросы":>9}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"память, КиБ":>13}  статусы'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<30}{result["queries"]:>9}{result["p50_ms"]:>10}'
+                f'{result["p95_ms"]:>10}{result["peak_kib"]:>13}  '
+                f'{",".join(map(str, result["statuses"]))}'
+            )
+            budget = QUERY_BUDGETS.get(name)
+            if budget is not None and result['queries'] > budget:
+                errors.append(
+                    f'{name}: {result["queries"]} запросов, '
+                    f'допустимо {budget}'
+                )
+            if (options['max_p95'] is not None
+                    and result['p95_ms'] > options['max_p95']):
+                errors.append(f'{name}: p95 {result["p95_ms"]} мс')
+            if (options['max_memory'] is not None
+                    and result['peak_kib'] > options['max_memory']):
+                errors.append(f'{name}: память {result["peak_kib"]} КиБ')
+            if any(status >= 500 for status in result['statuses']):
+                errors.append(f'{name}: ошибка сервера')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if errors:
+            raise CommandError(
+                'Превышены ограничения:\n' + '\n'.join(errors)
+            )
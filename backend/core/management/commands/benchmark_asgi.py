@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+
+from recipes.models import Recipe
+
+from . import benchmark_api
+
+HOST = '127.0.0.1'
+
+# Приложение и класс воркеров gunicorn для каждого режима.
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+
+STARTUP_TIMEOUT = 30
+
+REQUEST_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+async def fetch(port, path, delay=0):
+    """
+    GET запрос path, возвращает код ответа.
+
+    При delay клиент передает половину запроса и ждет delay секунд,
+    как клиент на медленной сети.
+    """
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        request = (f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\n'
+                   f'Connection: close\r\n\r\n').encode()
+        if delay:
+            middle = len(request) // 2
+            writer.write(request[:middle])
+            await writer.drain()
+            await asyncio.sleep(delay)
+            request = request[middle:]
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1]) if response else 0
+
+
+class LoadTest:
+    """Быстрые и медленные клиенты, одновременно запрашивающие paths."""
+
+    def __init__(self, port, paths, rng):
+        self.port = port
+        self.paths = paths
+        self.rng = rng
+
+    async def wait_ready(self, process):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                for path in self.paths:
+                    await fetch(self.port, path)
+                return True
+            except OSError:
+                await asyncio.sleep(0.2)
+        return False
+
+    async def client(self, delay, deadline, results):
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    fetch(self.port, self.rng.choice(self.paths), delay),
+                    REQUEST_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError):
+                status = 0
+            results.append((status, (time.perf_counter() - start) * 1000))
+
+    async def run(self, clients, slow_clients, slow_delay, duration):
+        deadline = time.monotonic() + duration
+        fast, slow = [], []
+        await asyncio.gather(*(
+            [self.client(0, deadline, fast) for _ in range(clients)]
+            + [self.client(slow_delay, deadline, slow)
+               for _ in range(slow_clients)]
+        ))
+        timings = [timing for _, timing in fast] or [0]
+        return {
+            'requests': len(fast),
+            'rps': round(len(fast) / duration, 1),
+            'p50_ms': round(benchmark_api.percentile(timings, 0.5), 2),
+            'p95_ms': round(benchmark_api.percentile(timings, 0.95), 2),
+            'errors': sum(status != 200 for status, _ in fast + slow),
+            'slow_requests': len(slow),
+            'statuses': sorted({status for status, _ in fast + slow}),
+        }
+
+
+class Command(benchmark_api.Command):
+    help = ('Сравнивает пропускную способность горячих URL под gunicorn '
+            'с синхронными воркерами (WSGI) и с воркерами uvicorn (ASGI) '
+            'при одновременных медленных клиентах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Количество процессов gunicorn'
+        )
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=10,
+            help='Количество быстрых клиентов'
+        )
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=50,
+            help='Количество медленных клиентов'
+        )
+        parser.add_argument(
+            '--slow-delay',
+            type=float,
+            default=2.0,
+            help='Пауза медленного клиента посреди запроса в секундах'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help='Длительность замера каждого режима в секундах'
+        )
+        parser.add_argument(
+            '--output',
+            help='Сохранить результаты в JSON файл'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять временную базу данных'
+        )
+
+    def handle(self, *args, **options):
+        # Серверы работают в отдельных процессах, поэтому тестовая база
+        # SQLite должна быть файлом, а не базой в памяти.
+        test_settings = connection.settings_dict['TEST']
+        if (connection.vendor == 'sqlite'
+                and not test_settings.get('NAME')):
+            test_settings['NAME'] = os.path.join(
+                tempfile.gettempdir(),
+                'foodgram_benchmark_asgi.sqlite3'
+            )
+        super().handle(*args, **options)
+
+    def run(self, options):
+        self.prepare(options)
+        rng = random.Random(options['seed'])
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        paths = [
+            '/api/recipes/',
+            '/api/recipes/?page=2',
+            '/api/tags/',
+            f'/api/ingredients/?name={quote("ингр")}',
+        ] + [
+            f'/api/recipes/{pk}/'
+            for pk in rng.sample(recipe_ids, min(len(recipe_ids), 20))
+        ]
+        return {
+            mode: self.measure_server(mode, paths, rng, options)
+            for mode in SERVERS
+        }
+
+    def measure_server(self, mode, paths, rng, options):
+        app, worker_class = SERVERS[mode]
+        port = free_port()
+        env = dict(
+            os.environ,
+            DB_ENGINE=connection.settings_dict['ENGINE'],
+            DB_NAME=connection.settings_dict['NAME'],
+            ASYNC_READ_VIEWS='1' if mode == 'asgi' else '',
+        )
+        with tempfile.TemporaryFile() as log:
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn.app.wsgiapp', app,
+                 '--bind', f'{HOST}:{port}',
+                 '--workers', str(options['workers']),
+                 '--worker-class', worker_class,
+                 '--log-level', 'warning'],
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT
+            )
+            try:
+                load_test = LoadTest(port, paths, rng)
+                if not asyncio.run(load_test.wait_ready(process)):
+                    log.seek(0)
+                    raise CommandError(
+                        f'Сервер {mode} не запустился:\n'
+                        f'{log.read().decode(errors="replace")[-2000:]}'
+                    )
+                result = asyncio.run(load_test.run(
+                    options['clients'],
+                    options['slow_clients'],
+                    options['slow_delay'],
+                    options['duration']
+                ))
+            finally:
+                process.terminate()
+                process.wait(STARTUP_TIMEOUT)
+        self.stdout.write(f'{mode}: {result["requests"]} запросов')
+        return result
+
+    def report(self, results, options):
+        self.stdout.write(
+            f'{"режим":<8}{"запросы":>9}{"в секунду":>11}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"ошибки":>8}{"медленные":>11}  статусы'
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<8}{result["requests"]:>9}{result["rps"]:>11}'
+                f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["errors"]:>8}{result["slow_requests"]:>11}  '
+                f'{",".join(map(str, result["statuses"]))}'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if any(status >= 500 for result in results.values()
+               for status in result['statuses']):
+            raise CommandError('Сервер вернул ошибку')
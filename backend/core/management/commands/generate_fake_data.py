@@ -0,0 +1,130 @@
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.matching import RECIPE_INGREDIENTS_VERSION_NAME
+from core.cache import bump_version
+from core.fake_data import (FakeDataGenerator, create_placeholder_images,
+                            create_users, recipe_tasks, relation_tasks)
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Создает пользователей, рецепты из загруженных ингредиентов '
+            'и тегов, избранное, списки покупок и подписки для нагрузочного '
+            'тестирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=20,
+            help='Среднее количество рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=5,
+            help='Среднее количество рецептов в списке покупок'
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=10,
+            help='Среднее количество подписок пользователя'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Количество процессов (только PostgreSQL)'
+        )
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--prefix', default='fake')
+        parser.add_argument('--seed', type=int)
+
+    def progress(self, title, total):
+        done = 0
+        start = time.monotonic()
+
+        def report(count):
+            nonlocal done
+            done += count
+            self.stdout.write(
+                f'{title}: {done}/{total} '
+                f'за {time.monotonic() - start:.1f} с'
+            )
+        return report
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if (workers > 1
+                and not connection.features.can_return_rows_from_bulk_insert):
+            raise CommandError(
+                'Несколько процессов поддерживаются только для баз данных, '
+                'возвращающих id при bulk_create (PostgreSQL)'
+            )
+        ingredients = list(Ingredient.objects.values_list('pk', 'name'))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not ingredients or not tag_ids:
+            raise CommandError(
+                'Справочники пусты, сначала выполните upload_data'
+            )
+        seed = options['seed']
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.stdout.write(f'seed: {seed}')
+
+        start = time.monotonic()
+        user_ids = [user.pk for user in create_users(
+            options['users'],
+            options['password'],
+            prefix=options['prefix']
+        )]
+        self.stdout.write(
+            f'Пользователи: {options["users"]} '
+            f'за {time.monotonic() - start:.1f} с'
+        )
+        generator = FakeDataGenerator(
+            user_ids,
+            ingredients,
+            tag_ids,
+            create_placeholder_images(),
+            seed=seed
+        )
+        generator.run(
+            'create_recipes',
+            recipe_tasks(options['recipes'], seed),
+            workers,
+            self.progress('Рецепты', options['recipes'])
+        )
+        generator.load_recipes(
+            list(Recipe.objects.values_list('pk', flat=True)),
+            seed
+        )
+        generator.run(
+            'create_relations',
+            relation_tasks(
+                user_ids,
+                seed,
+                options['favorites'],
+                options['carts'],
+                options['subscriptions']
+            ),
+            workers,
+            self.progress('Избранное, списки покупок и подписки',
+                          len(user_ids))
+        )
+        bump_version(RECIPE_INGREDIENTS_VERSION_NAME)
+        for command in ('update_counters', 'update_search',
+                        'update_trending'):
+            call_command(command, stdout=self.stdout)
+        self.stdout.write(
+            f'Готово за {time.monotonic() - start:.1f} с. '
+            f'Похожие рецепты: manage.py update_recommendations'
+        )
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.images import process_in_worker
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=max(settings.IMAGE_PROCESSING_WORKERS, 1),
+            help='Количество потоков обработки'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать и уже обработанные изображения'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_processed=False)
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for _ in executor.map(process_in_worker, recipe_ids):
+                pass
+        self.stdout.write(f'Обработано изображений: {len(recipe_ids)}')
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.paginators import RECIPES_RANKING_VERSION_NAME
+from core.cache import bump_version
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import User, UserSubscription
+
+# Модель, поле счетчика, связанная модель и поле связи с объектом.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', UserSubscription, 'following'),
+)
+
+
+def count_subquery(model, field):
+    """Подзапрос количества записей model, ссылающихся на OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики рецептов и авторов'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        for model, counter, related_model, field in COUNTERS:
+            updated = model.objects.update(
+                **{counter: count_subquery(related_model, field)}
+            )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{counter}: '
+                f'пересчитано {updated}'
+            )
+        transaction.on_commit(
+            lambda: bump_version(RECIPES_RANKING_VERSION_NAME)
+        )
@@ -0,0 +1,166 @@
+import math
+from collections import Counter, defaultdict
+from heapq import nlargest
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.recommendations import RECOMMENDATIONS_VERSION_NAME
+from core.cache import bump_version
+from recipes.models import (Favorite, IngredientRecipe, RecipeSimilarity,
+                            ShoppingCart, TagRecipe)
+
+# Вес добавления рецепта в избранное и в список покупок.
+EVENT_WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+
+# Вклад совместных добавлений и общих тегов и ингредиентов в сходство.
+COLLABORATIVE_WEIGHT = 0.7
+CONTENT_WEIGHT = 0.3
+
+# Сколько последних рецептов пользователя учитывать.
+MAX_USER_RECIPES = 200
+
+# Ингредиенты и теги, которые есть в большем числе рецептов
+# (соль, вода), не делают рецепты похожими.
+MAX_FEATURE_RECIPES = 1000
+
+# Похожие рецепты сохраняются пачками по мере расчета.
+BATCH_SIZE = 1000
+
+
+def collect_interactions():
+    """Рецепты каждого пользователя с весами добавлений."""
+    users = defaultdict(dict)
+    for model, weight in EVENT_WEIGHTS:
+        events = model.objects.order_by('user', '-created').values_list(
+            'user',
+            'recipe'
+        )
+        for user, recipe in events.iterator():
+            recipes = users[user]
+            if recipe in recipes or len(recipes) < MAX_USER_RECIPES:
+                recipes[recipe] = max(recipes.get(recipe, 0), weight)
+    return users
+
+
+def collect_norms(users):
+    """
+    Пользователи, добавившие каждый рецепт, и нормы векторов рецептов
+    для косинусного сходства.
+    """
+    raters = defaultdict(list)
+    norms = defaultdict(float)
+    for user, recipes in users.items():
+        for recipe, weight in recipes.items():
+            raters[recipe].append((user, weight))
+            norms[recipe] += weight * weight
+    return raters, norms
+
+
+def collaborative_similarity(recipe, users, raters, norms):
+    """
+    Косинусное сходство рецепта с рецептами, которые добавляли
+    те же пользователи.
+
+    Считается по одной строке матрицы сходства за раз, поэтому
+    в памяти не хранятся все пары рецептов.
+    """
+    products = defaultdict(float)
+    for user, weight in raters.get(recipe, ()):
+        for other, other_weight in users[user].items():
+            products[other] += weight * other_weight
+    products.pop(recipe, None)
+    return {
+        other: value / math.sqrt(norms[recipe] * norms[other])
+        for other, value in products.items()
+    }
+
+
+def collect_features():
+    """Ингредиенты и теги рецептов и обратный индекс по ним."""
+    features = defaultdict(set)
+    for model, field in ((IngredientRecipe, 'ingredient'),
+                         (TagRecipe, 'tag')):
+        rows = model.objects.values_list('recipe', field)
+        for recipe, value in rows.iterator():
+            features[recipe].add((field, value))
+    postings = defaultdict(list)
+    for recipe, items in features.items():
+        for feature in items:
+            postings[feature].append(recipe)
+    return features, postings
+
+
+def content_similarity(recipe, features, postings):
+    """Сходство Жаккара рецепта с рецептами с общими признаками."""
+    shared = Counter()
+    for feature in features.get(recipe, ()):
+        if len(postings[feature]) <= MAX_FEATURE_RECIPES:
+            shared.update(postings[feature])
+    shared.pop(recipe, None)
+    size = len(features.get(recipe, ()))
+    return {
+        other: count / (size + len(features[other]) - count)
+        for other, count in shared.items()
+    }
+
+
+def nearest_neighbours(users, features, postings, size):
+    """Для каждого рецепта size самых похожих рецептов."""
+    raters, norms = collect_norms(users)
+    for recipe in sorted(raters.keys() | features.keys()):
+        scores = defaultdict(float)
+        collaborative = collaborative_similarity(recipe, users, raters, norms)
+        for other, value in collaborative.items():
+            scores[other] += COLLABORATIVE_WEIGHT * value
+        content = content_similarity(recipe, features, postings)
+        for other, value in content.items():
+            scores[other] += CONTENT_WEIGHT * value
+        # При равном сходстве выбираются более новые рецепты.
+        for other, score in nlargest(size, scores.items(),
+                                     key=lambda item: (item[1], item[0])):
+            yield RecipeSimilarity(
+                recipe_id=recipe,
+                similar_id=other,
+                score=score
+            )
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по избранному, спискам '
+            'покупок, тегам и ингредиентам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours',
+            type=int,
+            default=settings.RECOMMENDATION_NEIGHBOURS,
+            help='Сколько похожих рецептов хранить для каждого рецепта'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        features, postings = collect_features()
+        similarities = nearest_neighbours(
+            collect_interactions(),
+            features,
+            postings,
+            options['neighbours']
+        )
+        RecipeSimilarity.objects.all().delete()
+        saved = 0
+        while True:
+            batch = list(islice(similarities, BATCH_SIZE))
+            if not batch:
+                break
+            RecipeSimilarity.objects.bulk_create(batch)
+            saved += len(batch)
+        transaction.on_commit(
+            lambda: bump_version(RECOMMENDATIONS_VERSION_NAME)
+        )
+        self.stdout.write(f'Сохранено похожих рецептов: {saved}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы рецептов'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(
+                'Полнотекстовый поиск доступен только в PostgreSQL'
+            )
+            return
+        updated = Recipe.objects.update_search_vector()
+        self.stdout.write(f'Обновлено рецептов: {updated}')
@@ -0,0 +1,98 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.paginators import RECIPES_RANKING_VERSION_NAME
+from core.cache import bump_version
+from recipes.models import Favorite, Recipe, ShoppingCart, TrendingState
+
+# Вес добавления рецепта в избранное и в список покупок.
+EVENT_WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+
+# Оценки меньше этого значения обнуляются.
+MIN_SCORE = 1e-3
+
+
+def decay(seconds):
+    """Множитель затухания оценки за seconds секунд."""
+    half_life = settings.TRENDING_HALF_LIFE.total_seconds()
+    return math.pow(0.5, seconds / half_life)
+
+
+def collect_scores(since, now):
+    """Вклад добавлений после since в оценки рецептов на момент now."""
+    scores = defaultdict(float)
+    for model, weight in EVENT_WEIGHTS:
+        events = model.objects.filter(
+            created__gt=since,
+            created__lte=now
+        ).values_list('recipe_id', 'created')
+        for recipe_id, created in events.iterator():
+            scores[recipe_id] += weight * decay(
+                (now - created).total_seconds()
+            )
+    return scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает оценку trending_score рецептов по недавним '
+            'добавлениям в избранное и списки покупок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать оценки с нуля вместо инкрементального обновления'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Блокировка строки не дает двум запускам применить затухание
+        # и добавить одни и те же события дважды. Строка создается
+        # миграцией, поэтому блокируется и при первом запуске.
+        state = TrendingState.objects.select_for_update().get(pk=1)
+        watermark = state.computed
+        if options['full'] or watermark is None:
+            Recipe.objects.exclude(trending_score=0).update(trending_score=0)
+            since = now - settings.TRENDING_WINDOW
+        else:
+            since = watermark
+            Recipe.objects.filter(trending_score__gte=MIN_SCORE).update(
+                trending_score=F('trending_score') * decay(
+                    (now - watermark).total_seconds()
+                )
+            )
+            Recipe.objects.filter(
+                trending_score__gt=0,
+                trending_score__lt=MIN_SCORE
+            ).update(trending_score=0)
+        scores = collect_scores(since, now)
+        recipes = Recipe.objects.filter(pk__in=scores.keys()).only(
+            'pk',
+            'trending_score'
+        )
+        for recipe in recipes:
+            recipe.trending_score += scores[recipe.pk]
+        Recipe.objects.bulk_update(
+            recipes,
+            ('trending_score',),
+            batch_size=1000
+        )
+        state.computed = now
+        state.save(update_fields=('computed',))
+        transaction.on_commit(
+            lambda: bump_version(RECIPES_RANKING_VERSION_NAME)
+        )
+        self.stdout.write(
+            f'Обновлено рецептов: {len(scores)}, '
+            f'события с {since:%Y-%m-%d %H:%M}'
+        )
@@ -1,26 +1,85 @@
 import csv
+import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 
+from api.autocomplete import INGREDIENTS_VERSION_NAME
+from api.mixins import TAGS_VERSION_NAME
+from core.cache import bump_version
 from recipes.models import Ingredient, Tag
 
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'color', 'slug')
+
+
+def read_rows(path, fields):
+    """Читает записи из CSV или JSON файла в виде кортежей полей fields."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return [tuple(row[field] for field in fields)
+                    for row in json.load(f)]
+        return [tuple(row[:len(fields)]) for row in csv.reader(f) if row]
+
 
 class Command(BaseCommand):
     help = 'Заполняет базу данных записями'
 
-    def handle(self, *args, **kwargs):
-        with open('data/ingredients.csv', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-        with open('data/tags.csv', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                Tag.objects.get_or_create(
-                    name=row[0],
-                    color=row[1],
-                    slug=row[2]
-                )
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл ингредиентов (.csv или .json)'
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(settings.BASE_DIR, 'data', 'tags.csv'),
+            help='Файл тегов (.csv или .json)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одном INSERT'
+        )
+
+    def upload(self, model, path, fields, key_fields, batch_size):
+        start = time.monotonic()
+        try:
+            rows = read_rows(path, fields)
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        existing = set(model.objects.values_list(*key_fields))
+        key_indexes = [fields.index(field) for field in key_fields]
+        new_objects = {}
+        for row in rows:
+            key = tuple(row[index] for index in key_indexes)
+            if key not in existing:
+                new_objects.setdefault(key, model(**dict(zip(fields, row))))
+        objects = list(new_objects.values())
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(
+            fields,
+            objects
+        ) or batch_size)
+        model.objects.bulk_create(
+            objects,
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: в файле {len(rows)}, '
+            f'добавлено {len(objects)} '
+            f'за {time.monotonic() - start:.3f} с'
+        )
+        return len(objects)
+
+    def handle(self, *args, **options):
+        if self.upload(Ingredient, options['ingredients'], INGREDIENT_FIELDS,
+                       INGREDIENT_FIELDS, options['batch_size']):
+            bump_version(INGREDIENTS_VERSION_NAME)
+        if self.upload(Tag, options['tags'], TAG_FIELDS, ('slug',),
+                       options['batch_size']):
+            bump_version(TAGS_VERSION_NAME)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger('foodgram.queries')
+
+NUMBER_RE = re.compile(r'\b\d+\b')
+PLACEHOLDERS_RE = re.compile(r'%s(, %s)+')
+
+
+def fingerprint(sql):
+    """SQL запроса без чисел и с одним %s в списках параметров."""
+    return PLACEHOLDERS_RE.sub('%s', NUMBER_RE.sub('?', sql))
+
+
+class QueryRecorder:
+    """Обертка execute_wrapper: считает запросы и время в базе данных."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """Запросы, которые выполнялись больше одного раза."""
+        return {sql: count for sql, count in self.fingerprints.items()
+                if count > 1}
+
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_current(execute, sql, params, many, context):
+    """
+    Обертка execute_wrapper всех соединений: передает запрос recorder
+    текущего контекста. Контекст копируется asgiref в потоки
+    sync_to_async, поэтому учитываются и запросы синхронных
+    представлений под ASGI.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection, **kwargs):
+    """Обработчик connection_created: добавляет record_current."""
+    if record_current not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_current)
+
+
+@contextmanager
+def record_queries(recorder):
+    """
+    Контекстный менеджер, передающий recorder запросы всех соединений
+    в текущем контексте.
+
+    Запросы передаются оберткой record_current, которую install_recorder
+    добавляет к соединениям только при включенном SQL_INSTRUMENTATION.
+    """
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+
+
+class RequestStats:
+    """Статистика запросов к базе данных по представлениям в памяти."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.views = defaultdict(lambda: {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_time': 0.0,
+            'total_time': 0.0,
+            'duplicate_queries': 0,
+        })
+
+    def add(self, view, recorder, total_time):
+        duplicates = sum(count - 1 for count in recorder.duplicates().values())
+        with self.lock:
+            stats = self.views[view]
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['max_queries'] = max(stats['max_queries'], recorder.count)
+            stats['db_time'] += recorder.duration
+            stats['total_time'] += total_time
+            stats['duplicate_queries'] += duplicates
+
+    def snapshot(self):
+        """Средние и максимальные значения по каждому представлению."""
+        with self.lock:
+            views = {view: dict(stats) for view, stats in self.views.items()}
+        return {
+            view: {
+                'requests': stats['requests'],
+                'avg_queries': stats['queries'] / stats['requests'],
+                'max_queries': stats['max_queries'],
+                'avg_db_ms': stats['db_time'] * 1000 / stats['requests'],
+                'avg_total_ms': (stats['total_time'] * 1000
+                                 / stats['requests']),
+                'duplicate_queries': stats['duplicate_queries'],
+            }
+            for view, stats in sorted(views.items())
+        }
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+request_stats = RequestStats()
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает запросы к базе данных и время обработки каждого запроса.
+
+    Включается настройкой SQL_INSTRUMENTATION. Результат добавляется
+    в заголовок Server-Timing, пишется в лог foodgram.queries строкой
+    JSON и накапливается в request_stats. Поддерживает ASGI без
+    перехода в отдельный поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with record_queries(recorder):
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start):
+        total_time = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        duplicates = recorder.duplicates()
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries", '
+            f'total;dur={total_time * 1000:.1f}'
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total_time * 1000, 2),
+            'duplicates': [
+                {'sql': sql, 'count': count}
+                for sql, count in duplicates.items()
+            ],
+        }, ensure_ascii=False))
+        request_stats.add(view, recorder, total_time)
+        return response
@@ -0,0 +1,23 @@
+class ProtectedFieldsMixin:
+    """
+    Не перезаписывает поля protected_fields при сохранении
+    существующего объекта без update_fields.
+
+    Такие поля (счетчики, вычисляемые значения) изменяются в базе
+    данных через F() и update(), а в загруженном объекте может быть
+    устаревшее значение: сохранение из API или админки затерло бы
+    изменения, сделанные за это время.
+    """
+    protected_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            skipped = set(self.protected_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+                and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,19 @@
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Синхронный код каждого запроса выполняется в своем потоке,
+    а не в одном общем для всего процесса, поэтому синхронные
+    представления не ждут друг друга.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
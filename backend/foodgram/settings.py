@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
@@ -22,17 +23,19 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
     'djoser',
-    'users',
-    'recipes',
-    'api',
+    'users.apps.UsersConfig',
+    'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
     'core'
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +65,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -73,6 +78,18 @@ DATABASES = {
     }
 }
 
+# Кэш в памяти процесса подходит только для разработки и тестов,
+# в docker-compose используется memcached (см. core/checks.py).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,6 +121,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60
+
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+
+IMAGE_VARIANT_QUALITY = 85
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+INGREDIENT_INDEX_MAX_SIZE = 50000
+
+API_CACHE_TIMEOUT = 60 * 60 * 24
+
+API_CACHE_MAX_AGE = 60
+
+TRENDING_HALF_LIFE = timedelta(days=3)
+
+TRENDING_WINDOW = timedelta(days=14)
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -132,3 +172,40 @@ DJOSER = {
         'user_create': 'api.serializers.UserRegistrationSerializer',
     },
 }
+
+# Количество похожих рецептов, которое хранится для каждого рецепта.
+RECOMMENDATION_NEIGHBOURS = 20
+
+RECOMMENDATION_CACHE_TIMEOUT = 60 * 60
+
+FEED_CACHE_TIMEOUT = 60 * 5
+
+# Счетчики запросов к базе данных в заголовке Server-Timing и в логе.
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', '') == '1'
+
+# Асинхронные представления рецептов, тегов и ингредиентов,
+# включаются в foodgram.asgi.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '') == '1'
+
+# Потоки, в которых асинхронные представления обращаются к базе данных.
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', 10))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.queries': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'foodgram.images': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
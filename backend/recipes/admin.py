@@ -41,7 +41,8 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'text',
         'author',
-        'created'
+        'created',
+        'favorites_count'
     )
     list_display_links = ('name',)
     list_filter = ('name', 'author', 'tags')
@@ -50,7 +51,7 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
     def in_favorite(self, recipe):
-        return recipe.favorite.count()
+        return recipe.favorites_count
 
 
 admin.site.register(Recipe, RecipeAdmin)
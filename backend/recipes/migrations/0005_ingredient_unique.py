@@ -0,0 +1,43 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Оставляет один ингредиент с данным названием и единицей измерения.
+
+    Ссылки рецептов на дубликаты переносятся на оставшийся ингредиент,
+    повторы в одном рецепте удаляет 0008_unique_relations.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name',
+        'measurement_unit'
+    ).annotate(first_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=duplicate['first_id'])
+        IngredientRecipe.objects.filter(ingredient__in=extra).update(
+            ingredient_id=duplicate['first_id']
+        )
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_measurement_unit'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.19 on 2026-10-18 07:35
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+UNIQUE_FIELDS = {
+    'Favorite': ('user', 'recipe'),
+    'ShoppingCart': ('user', 'recipe'),
+    'TagRecipe': ('recipe', 'tag'),
+    'IngredientRecipe': ('recipe', 'ingredient'),
+}
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name, fields in UNIQUE_FIELDS.items():
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            first_id=Min('id'),
+            total=Count('id')
+        ).filter(total__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                **{field: duplicate[field] for field in fields}
+            ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_created_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created'], name='recipe_author_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+    ]
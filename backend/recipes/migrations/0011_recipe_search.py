@@ -0,0 +1,92 @@
+# Generated by Django 2.2.19 on 2026-10-18 04:59
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField
+
+SEARCH_INDEXES = (
+    django.contrib.postgres.indexes.GinIndex(
+        fields=['search_vector'],
+        name='recipe_search_vector_idx'
+    ),
+    django.contrib.postgres.indexes.GinIndex(
+        fields=['name'],
+        name='recipe_name_trgm_idx',
+        opclasses=['gin_trgm_ops']
+    ),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN индексы и расширение pg_trgm есть только в PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    model = apps.get_model('recipes', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('recipes', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(model, index)
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Копия Recipe.objects.update_search_vector() на момент миграции."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    SearchVector = django.contrib.postgres.search.SearchVector
+    ingredients = Subquery(
+        IngredientRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names'),
+        output_field=TextField()
+    )
+    Recipe.objects.using(schema_editor.connection.alias).update(
+        search_vector=(
+            SearchVector('name', weight='A', config='russian')
+            + SearchVector(ingredients, weight='B', config='russian')
+            + SearchVector('text', weight='C', config='russian')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    create_search_indexes,
+                    drop_search_indexes
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='recipe', index=index)
+                for index in SEARCH_INDEXES
+            ],
+        ),
+        migrations.RunPython(
+            fill_search_vectors,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_search_names(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    ingredients = list(Ingredient.objects.only('name'))
+    for ingredient in ingredients:
+        ingredient.search_name = ingredient.name.casefold().replace('ё', 'е')
+    Ingredient.objects.bulk_update(
+        ingredients,
+        ['search_name'],
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+    ]
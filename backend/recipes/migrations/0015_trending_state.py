@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def create_state(apps, schema_editor):
+    TrendingState = apps.get_model('recipes', 'TrendingState')
+    TrendingState.objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_ingredient_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed', models.DateTimeField(null=True, verbose_name='Время пересчета')),
+            ],
+            options={
+                'verbose_name': 'Состояние оценки trending',
+                'verbose_name_plural': 'Состояние оценки trending',
+            },
+        ),
+        migrations.RunPython(create_state, migrations.RunPython.noop),
+    ]
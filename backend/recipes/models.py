@@ -1,7 +1,15 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField,
+                                            TrigramSimilarity)
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import (Case, Exists, F, FloatField, OuterRef, Prefetch,
+                              Q, Subquery, TextField, Value, When)
 
-from users.models import User
+from core.models import ProtectedFieldsMixin
+from users.models import User, UserSubscription
 
 
 class Tag(models.Model):
@@ -17,19 +25,166 @@ class Tag(models.Model):
         return self.name
 
 
+def normalize(value):
+    """Приводит строку к виду для поиска: нижний регистр, ё -> е."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create не вызывает save(), поэтому search_name здесь."""
+        objs = list(objs)
+        for ingredient in objs:
+            ingredient.search_name = normalize(ingredient.name)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=200)
     measurement_unit = models.CharField(max_length=200)
+    # Нормализованное название для поиска по префиксу. Индекс по нему
+    # в PostgreSQL дополняется индексом varchar_pattern_ops, который
+    # используется для LIKE 'префикс%', в отличие от name__istartswith.
+    search_name = models.CharField(
+        max_length=200,
+        db_index=True,
+        editable=False
+    )
+
+    objects = IngredientQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_measurement_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
+        super().save(*args, **kwargs)
+
+
+SEARCH_CONFIG = 'russian'
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов с аннотациями для request.user."""
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты флагами favorited и in_shopping_cart
+        одним запросом вместо отдельного .exists() на каждый рецепт.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                favorited=Value(False, models.BooleanField()),
+                in_shopping_cart=Value(False, models.BooleanField())
+            )
+        return self.annotate(
+            favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            ))
+        )
+
+    def search(self, query):
+        """
+        Поиск рецептов по названию, ингредиентам и описанию.
 
-class Recipe(models.Model):
+        Рецепты аннотируются релевантностью search_rank. В PostgreSQL
+        используется полнотекстовый индекс search_vector, опечатки в
+        названии находятся по триграммам. В других базах данных
+        выполняется поиск по подстроке.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.annotate(
+                ingredient_match=Exists(IngredientRecipe.objects.filter(
+                    recipe=OuterRef('pk'),
+                    ingredient__name__icontains=query
+                ))
+            ).filter(
+                Q(name__icontains=query)
+                | Q(text__icontains=query)
+                | Q(ingredient_match=True)
+            ).annotate(search_rank=Case(
+                When(name__icontains=query, then=Value(1.0)),
+                When(ingredient_match=True, then=Value(0.5)),
+                default=Value(0.1),
+                output_field=FloatField()
+            ))
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return self.filter(
+            Q(search_vector=search_query) | Q(name__trigram_similar=query)
+        ).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+            + TrigramSimilarity('name', query)
+        )
+
+    def update_search_vector(self):
+        """Пересчитывает search_vector рецептов (только PostgreSQL)."""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        ingredients = Subquery(
+            IngredientRecipe.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names'),
+            output_field=TextField()
+        )
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(ingredients, weight='B', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def with_related(self, user):
+        """
+        Подгружает автора, теги и ингредиенты рецептов пачкой,
+        чтобы сериализаторы не ходили в базу за каждым рецептом.
+
+        Автор аннотируется флагом subscribed для request.user,
+        ингредиенты с количеством кладутся в атрибут ingredient_amounts.
+        """
+        if user.is_authenticated:
+            subscribed = Exists(UserSubscription.objects.filter(
+                user=user,
+                following=OuterRef('pk')
+            ))
+        else:
+            subscribed = Value(False, models.BooleanField())
+        return self.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(subscribed=subscribed)
+            ),
+            'tags',
+            Prefetch(
+                'ingredientrecipe_set',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ),
+                to_attr='ingredient_amounts'
+            )
+        )
+
+
+class Recipe(ProtectedFieldsMixin, models.Model):
     name = models.CharField(max_length=200)
     text = models.TextField()
     cooking_time = models.PositiveIntegerField(
@@ -38,6 +193,27 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to='recipe/images/',
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False
+    )
+    trending_score = models.FloatField(
+        'Популярность за последнее время',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    image_processed = models.BooleanField(
+        'Уменьшенные копии изображения созданы',
+        default=False,
+        editable=False
+    )
     author = models.ForeignKey(
         User, on_delete=models.CASCADE
     )
@@ -50,15 +226,63 @@ class Recipe(models.Model):
         'Дата создания',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    protected_fields = (
+        'favorites_count',
+        'cart_count',
+        'trending_score',
+        'search_vector',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-created',)
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-created'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-created', '-id'],
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-created', '-id'],
+                name='recipe_trending_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+            GinIndex(
+                fields=['name'],
+                name='recipe_name_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            )
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        # Имя изображения в базе, чтобы после замены удалить копии старого.
+        recipe._loaded_image = recipe.__dict__.get('image')
+        return recipe
+
 
 class TagRecipe(models.Model):
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE, )
@@ -67,6 +291,12 @@ class TagRecipe(models.Model):
     class Meta:
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'tag'],
+                name='unique_recipe_tag'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.tag}'
@@ -83,6 +313,12 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.ingredient} {self.amount}'
@@ -98,10 +334,21 @@ class Favorite(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorite')
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite_user_recipe'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
@@ -118,10 +365,67 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='is_in_shopping_cart'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart_user_recipe'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт из top-K соседей рецепта, считается пакетно."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.similar}'
+
+
+class TrendingState(models.Model):
+    """
+    Время последнего пересчета trending_score.
+
+    Одна строка с pk=1, созданная миграцией: update_trending блокирует
+    ее на время пересчета и сохраняет время в той же транзакции,
+    что и оценки.
+    """
+    computed = models.DateTimeField('Время пересчета', null=True)
+
+    class Meta:
+        verbose_name = 'Состояние оценки trending'
+        verbose_name_plural = 'Состояние оценки trending'
+
+    def __str__(self):
+        return f'{self.computed}'
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.images import schedule_recipe_image, schedule_release_image
+from users.models import User
+
+from .models import Favorite, Ingredient, Recipe, ShoppingCart
+
+# Поля рецепта, из которых составляется search_vector.
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счетчик field объекта pk, не опуская его ниже 0."""
+    objects = model.objects.filter(pk=pk)
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'cart_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'cart_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+def image_replaced(instance, update_fields):
+    """Отличается ли изображение рецепта от загруженного из базы."""
+    if update_fields is not None and 'image' not in update_fields:
+        return False
+    return getattr(instance, '_loaded_image', None) != instance.image.name
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_changing(sender, instance, update_fields, **kwargs):
+    if image_replaced(instance, update_fields):
+        instance.image_processed = False
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, update_fields, **kwargs):
+    """
+    Создает уменьшенные копии нового изображения рецепта и удаляет
+    копии замененного, в том числе при сохранении из админки.
+    """
+    if not image_replaced(instance, update_fields):
+        return
+    loaded = getattr(instance, '_loaded_image', None)
+    instance._loaded_image = instance.image.name
+    if loaded:
+        schedule_release_image(loaded)
+    if instance.image:
+        schedule_recipe_image(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    if instance.image:
+        schedule_release_image(instance.image.name)
+
+
+def refresh_search_vector(recipes):
+    """
+    Пересчитывает search_vector рецептов после фиксации транзакции,
+    когда ингредиенты рецепта, записанные после него, уже сохранены.
+    """
+    transaction.on_commit(lambda: recipes.update_search_vector())
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_changed(sender, instance, update_fields, **kwargs):
+    """
+    Сохранение рецепта из API или админки обновляет search_vector,
+    в том числе при изменении одних ингредиентов: рецепт сохраняется
+    вместе с ними.
+    """
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        refresh_search_vector(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_search_changed(sender, instance, created, update_fields,
+                              **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    refresh_search_vector(Recipe.objects.filter(ingredients=instance))
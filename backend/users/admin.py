@@ -12,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         'last_name',
         'email',
         'username',
+        'recipes_count',
+        'followers_count',
     )
     list_filter = ('email', 'username')
     list_display_links = ('username',)
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.19 on 2026-10-18 08:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'cart_count', 'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count',
+     'users', 'UserSubscription', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model_name, counter, related_app, related_name, field in COUNTERS:
+        related = apps.get_model(related_app, related_name)
+        apps.get_model(app, model_name).objects.update(**{
+            counter: Coalesce(
+                Subquery(
+                    related.objects.filter(
+                        **{field: OuterRef('pk')}
+                    ).order_by().values(field).annotate(
+                        total=Count('pk')
+                    ).values('total'),
+                    output_field=IntegerField()
+                ),
+                0
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20230330_1343'),
+        ('recipes', '0009_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
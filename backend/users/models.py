@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from core.models import ProtectedFieldsMixin
 
-class User(AbstractUser):
+
+class User(ProtectedFieldsMixin, AbstractUser):
     email = models.EmailField(
         max_length=254,
         unique=True
@@ -17,6 +19,18 @@ class User(AbstractUser):
     last_name = models.CharField(
         max_length=150
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
+
+    protected_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         constraints = [
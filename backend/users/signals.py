@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.signals import change_counter
+
+from .models import User, UserSubscription
+
+
+@receiver(post_save, sender=UserSubscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.following_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=UserSubscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.following_id, 'followers_count', -1)